@@ -0,0 +1,8 @@
+import os, sys
+
+# The modules of the tools import each other from this folder, as they do when main.py is run from it
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import main
+
+main(prog="python -m lsj_logeion_tools")
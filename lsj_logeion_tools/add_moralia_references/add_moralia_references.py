@@ -1,45 +1,55 @@
 from lxml import etree
 from utilities.utilities import *
+from annotation.annotation import Annotations, annotate
+from resolvers.resolvers import Resolver, get_resolver
 
 # COLLECTION OF REFERENCES.
 
 # TODO: Abstract the collection functions to create single-action functions.
 
-def get_plutarch_elements(root: etree.Element) -> list[etree.Element]:
+def get_plutarch_elements(root: etree.Element, last_author: dict=None) -> list[etree.Element]:
     """Returns a list of those elements in the root which meet the contain at least one valid, unwrapped stephanus reference
     in its tail node, and whose nearest, preceding <author> element refers to Plutarch.
+
+    last_author optionally carries the last <author> tag from one call to the next, e.g. between the entries of a file.
     """
+    return [element for element, resolver in get_reference_elements(root, last_author) if resolver.author == "Plu."]
 
-    # Loop through the elements, keeping a track of the last <author> tag
-    last_author = {"author": None}
-
-    # A custom traversal is required due to the nature of searching for references in the tail of elements.
-    def traverse(node: etree.Element, cache, result: list[etree.Element]):
-        """This traversal is called "depth-first post-order" and ensures any author elements are checked first where they 
-        are children of elements with references in the tail node.
-        """
-        if node is None:
-            return result
-        
-        if node.tag == "author" and node.text != "Id.":
-            cache["author"] = node.text
-
-        for child in node:
-            result = traverse(child, cache, result)
-
-        if has_unwrapped_reference(node, cache["author"]):
-            result.append(node)
-    
-        return result
+def get_reference_elements(root: etree.Element, last_author: dict=None, annotations: Annotations=None) -> list[tuple[etree.Element, Resolver]]:
+    """Returns a list of those elements in the root which contain at least one valid, unwrapped reference in their tail
+    node to an author with a registered resolver, i.e. the author of the nearest, preceding <author> element. Each is
+    returned with the resolver for its references, so that one traversal covers every registered author.
+
+    last_author optionally carries the last <author> tag from one call to the next, e.g. between the entries of a file.
+    annotations optionally gives the annotations of the root, made by annotate, which are otherwise made here.
+    """
+    if annotations is None:
+        annotations = annotate(root, last_author)
+
+    result = []
+
+    # The elements are taken in the order in which their tails are reached, so that any author elements are checked
+    # first where they are children of elements with references in the tail node
+    for node, author, inside_bibl in zip(annotations.tail_order, annotations.tail_authors, annotations.tail_inside_bibl):
+        resolver = get_resolver(author)
+
+        if resolver is not None and has_unwrapped_reference(node, author, inside_bibl, resolver):
+            result.append((node, resolver))
 
-    return traverse(root, last_author, [])
+    return result
 
-def has_unwrapped_reference(node: etree.Element, last_author: str) -> bool:
-    """Defines the conditions for what is deemed a valid stephanus requiring wrapping.
+def has_unwrapped_reference(node: etree.Element, last_author: str, inside_bibl: bool=None, resolver: Resolver=None) -> bool:
+    """Defines the conditions for what is deemed a valid reference requiring wrapping.
+
+    inside_bibl is whether the node has a <bibl> ancestor; if it is not given, the ancestors are searched.
+    resolver is the resolver for the last author's references; if it is not given, it is looked up.
     """
 
-    # only elements whose nearest, preceding <author> element refers to Plutarch are valid
-    if not last_author == "Plu.":
+    # only elements whose nearest, preceding <author> element refers to an author with a resolver are valid
+    if resolver is None:
+        resolver = get_resolver(last_author)
+
+    if resolver is None or resolver.author != last_author:
         return False
     
     # <title> elements with apparent stephanus tend actually to be inscriptions
@@ -47,67 +57,70 @@ def has_unwrapped_reference(node: etree.Element, last_author: str) -> bool:
         return False
     
     # only references which are nor already part of <bibl> elements are valid for wrapping
-    bibl_ancestor = [e for e in node.iterancestors() if e.tag == "bibl"]
-    
-    if len(bibl_ancestor) > 0:
-        assert(len(bibl_ancestor) == 1) # there should never be more than one <bibl> ancestor
+    if inside_bibl is None:
+        bibl_ancestor = [e for e in node.iterancestors() if e.tag == "bibl"]
+        assert(len(bibl_ancestor) <= 1) # there should never be more than one <bibl> ancestor
+        inside_bibl = len(bibl_ancestor) > 0
+
+    if inside_bibl:
         return False
     
     # references in the tail only; references in the text node are invalid
-    if not has_reference(node.tail):
+    if not resolver.has_reference(node.tail):
         return False
 
     return True
 
 # INSERTION OF NEW ELEMENTS
 
-def wrap_references(element: etree.Element, new_elements: list[etree.Element]=[]) -> list[etree.Element]:
+def wrap_references(element: etree.Element, new_elements: list[etree.Element]=None, resolver: Resolver=None) -> list[etree.Element]:
     """Wrap all stephanus references in the tail of a given element with an appropriate <bibl> tag.
 
+    The tail is split around all of its references at once, and the new <bibl> elements are inserted after the element.
+    resolver finds and resolves the references, and defaults to that of Plutarch's Moralia.
+
     Returns a list of the newly wrapped <bibl> references.
     """
+    if new_elements is None:
+        new_elements = []
 
-    new_element = wrap_bibl_element(element)
-    new_elements.append(new_element)
+    if resolver is None:
+        resolver = get_resolver("Plu.")
 
-    while has_reference(new_element.tail):
-        new_element = wrap_bibl_element(new_element)
-        new_elements.append(new_element)
+    tail = element.tail
+    references = resolver.find_references(tail)
 
-    return new_elements
+    if not references:
+        return new_elements
 
-def wrap_bibl_element(element: etree.Element) -> etree.Element:
-    """Wraps the first stephanus reference in the tail of a given element in a new, appropriate <bibl> element.
+    parent = element.getparent()
+    index = parent.index(element) + 1 # +1 because we will insert *after* the existing element
 
-    Returns the new <bibl> element.
-    """
+    # Replace the element's tail with any string preceding the first reference
+    element.tail = tail[:references[0].start]
 
-    parent = element.getparent()
-    index = parent.index(element) + 1 # +1 because we will insert *after* the existing author element
-    tail = element.tail
+    for i, reference in enumerate(references):
+        # each new <bibl> element's tail runs up to the next reference
+        tail_end = references[i + 1].start if i + 1 < len(references) else len(tail)
 
-    separated_tail = get_string_reference(tail, 1)
-    
-    assert(len(separated_tail) == 3) # one reference was found
+        new_bibl_element = make_bibl_element(reference, tail[reference.end:tail_end], resolver)
+        parent.insert(index + i, new_bibl_element)
+        new_elements.append(new_bibl_element)
 
-    # Replace the element's tail with any string preceding the reference
-    element.tail = separated_tail[0]
+    return new_elements
 
-    stephanus = clean_stephanus(separated_tail[1])
+def make_bibl_element(reference: Reference, tail: str, resolver: Resolver) -> etree.Element:
+    """Returns a new, appropriate <bibl> element for a stephanus reference, with the given tail.
+    """
+    author, work, title = resolver.resolve(reference)
 
-    global moralia_abbreviations
-    author, work, title = get_tlg_reference(stephanus, moralia_abbreviations)
-    
-    new_bibl_element = etree.Element("bibl", {"n": f"Perseus:abo:tlg,{author:04d},{work:03d}:{stephanus}"})
-    new_bibl_element.tail = separated_tail[2]
+    new_bibl_element = etree.Element("bibl", {"n": f"Perseus:abo:tlg,{author:04d},{work:03d}:{reference.stephanus}"})
+    new_bibl_element.tail = tail
 
     title_element = etree.SubElement(new_bibl_element, "title")
     title_element.text = title
-    title_element.tail = " " + separated_tail[1]
+    title_element.tail = " " + reference.raw
 
-    etree_print(new_bibl_element)
-        
-    parent.insert(index, new_bibl_element)
-    
-    return new_bibl_element
+    etree_print(new_bibl_element, level=2)
 
+    return new_bibl_element
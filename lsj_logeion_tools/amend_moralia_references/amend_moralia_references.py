@@ -1,11 +1,25 @@
 import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import NamedTuple
 from lxml import etree
 from utilities.utilities import *
-from copy import deepcopy
+from annotation.annotation import Annotations, annotate
 
-def get_moralia_bibls(root: etree.Element) -> list[etree.Element]:
-    """Returns a list of <bibl> elements referring to Plutarch's Moralia."""
-    return [e for e in root.iter() if is_valid_moralia(e)]
+# the first stephanus reference in the text of a <bibl>
+re_bibl_stephanus = re.compile(r"\b([1-9]\d{0,3}[a-f])\b")
+
+# all of the text within an element, as "".join(element.itertext())
+xpath_string = etree.XPath("string()", smart_strings=False)
+
+def get_moralia_bibls(root: etree.Element, annotations: Annotations=None) -> list[etree.Element]:
+    """Returns a list of <bibl> elements referring to Plutarch's Moralia.
+
+    annotations optionally gives the annotations of the root, whose <bibl> elements are taken rather than traversing it.
+    """
+    elements = root.iter() if annotations is None else annotations.bibls.values()
+
+    return [e for e in elements if is_valid_moralia(e)]
 
 def is_valid_moralia(element: etree.Element) -> bool:
     """Returns a boolean to test if an element is a valid <bibl> element for Plutarch's Moralia."""
@@ -26,67 +40,181 @@ def is_valid_moralia(element: etree.Element) -> bool:
     if author not in ["0007", "0094"]:
         return False
     
-    global moralia_abbreviations
-    moralia_works = moralia_abbreviations["work"].unique()
     work = int(work)
-    if work not in moralia_works:
+    if work not in get_moralia_table().valid_works:
         return False
 
     return True
 
-def process_moralia_bibls(bibls: list[etree.Element]) -> list[etree.Element]:
-    
-    return [e for e in bibls if process_moralia_bibl(e) is not False]
+def process_moralia_bibls(bibls: list[etree.Element], amendments_counter: Counter=None, change_log: list[dict]=None, annotations: Annotations=None) -> list[etree.Element]:
+    """Checks all of the <bibl> elements at once, then amends those which need it, in order. Returns the <bibl> elements
+    amended.
+
+    annotations optionally gives the annotations of the tree, e.g. those made for the add stage. Otherwise each part of
+    an entry in which a previous <title> is sought is annotated once, when it is first needed.
+    """
+    checks = check_moralia_bibls(bibls)
+
+    if annotations is None:
+        annotations = {}
+
+    return [
+        bibl for bibl, check in zip(bibls, checks)
+        if check.needs_amending() and amend_moralia_bibl(bibl, check, annotations, amendments_counter, change_log)
+    ]
+
+def process_moralia_bibl(bibl: etree.Element, annotations: Annotations | dict=None, amendments_counter: Counter=None, change_log: list[dict]=None) -> bool:
+    """Tests various aspects of the <bibl> element and amends as necessary.
+
+    annotations optionally gives the annotations of the tree, or caches the annotations of each search scope between
+    calls (see get_title_annotations).
+    amendments_counter optionally counts the amendments made, by kind.
+    change_log optionally collects a record of each amended <bibl> element.
+    """
+    return amend_moralia_bibl(bibl, check_moralia_bibls([bibl])[0], annotations, amendments_counter, change_log)
+
+class BiblCheck(NamedTuple):
+    """The amendments to the "n" attribute of a <bibl> element, worked out before any <bibl> is amended."""
+    n_attribute: str
+    n_stephanus_doesnt_match: bool
+    n_stephanus_not_in_work_range: bool
+    new_n_attribute: str
+    # the work of the original "n" attribute, whose abbreviation the <title> should have, or None if there is no such work
+    moralia_work: MoraliaWork | None
+    # whether the <bibl> has a <title> with that abbreviation
+    title_correct: bool
+
+    def needs_amending(self) -> bool:
+        """Returns False if amend_moralia_bibl would leave the <bibl> as it is."""
+        return self.n_stephanus_doesnt_match or self.n_stephanus_not_in_work_range or not self.title_correct
+
+def check_moralia_bibls(bibls: list[etree.Element]) -> list[BiblCheck]:
+    """Checks the "n" attribute and <title> of each <bibl> element against its text and the works of the Moralia.
+
+    The attribute, text and title of every <bibl> are gathered first, and then the stephanus of each is tested against
+    the range of its work, all at once.
+    """
+    work_rows = get_work_rows()
+    gathered = []
+    ordinals = []
+    rows = []
+
+    for bibl in bibls:
+        n_attribute = bibl.get("n")
+        n_author, n_work, n_stephanus = parse_n_attribute(n_attribute)
+
+        # the stephanus in the text is the one used from here on
+        regex_calls["process_moralia_bibl"] += 1
+        text_stephanus = re_bibl_stephanus.search(xpath_string(bibl)).group()
+
+        gathered.append((bibl, n_attribute, n_author, int(n_work), n_stephanus, text_stephanus))
+        ordinals.append(stephanus_ordinal(text_stephanus))
+        rows.append(work_rows.get((int(n_author), int(n_work)), -1))
+
+    in_range, work_indexes = check_work_ranges(ordinals, rows)
+    table = get_moralia_table()
+    works_by_end = table.work_index.works
+    checks = []
+
+    for (bibl, n_attribute, n_author, n_work, n_stephanus, text_stephanus), row, bibl_in_range, work_index in zip(gathered, rows, in_range, work_indexes):
+        doesnt_match = n_stephanus != text_stephanus
+        new_n_attribute = f"Perseus:abo:tlg,{n_author},{n_work:03d}:{text_stephanus}" if doesnt_match else n_attribute
+
+        if row == -1:
+            checks.append(BiblCheck(n_attribute, doesnt_match, False, new_n_attribute, None, True))
+            continue
+
+        if not bibl_in_range:
+            if work_index == len(works_by_end):
+                raise ValueError(f"stephanus ({text_stephanus}) is too large for Plutarch's Moralia")
+
+            new_work = works_by_end[work_index]
+            new_n_attribute = f"Perseus:abo:tlg,{new_work.author:04},{new_work.work:03}:{text_stephanus}"
+
+        moralia_work = table.works[row]
+        title_element = bibl.find("title")
+        title_correct = title_element is not None and title_element.text.replace("[", "").replace("]", "") == moralia_work.abbreviation
+
+        checks.append(BiblCheck(n_attribute, doesnt_match, not bibl_in_range, new_n_attribute, moralia_work, title_correct))
+
+    return checks
+
+@lru_cache(maxsize=None)
+def get_work_rows() -> dict[tuple[int, int], int]:
+    """Returns the row of each work in the Moralia table by its TLG author and work numbers."""
+    return {(w.author, w.work): row for row, w in enumerate(get_moralia_table().works)}
+
+@lru_cache(maxsize=None)
+def get_work_ranges() -> tuple[list[int], list[int]]:
+    """Returns the ordinals of the first and last stephanus of each work in the Moralia table, by row."""
+    works = get_moralia_table().works
+    return [stephanus_ordinal(w.start) for w in works], [stephanus_ordinal(w.end) for w in works]
+
+@lru_cache(maxsize=None)
+def get_numpy():
+    """Returns NumPy, imported on first use rather than when the tools start, or None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        # the range checks of check_work_ranges are made one at a time instead
+        return None
+
+    return numpy
+
+def check_work_ranges(ordinals: list[int], rows: list[int]) -> tuple[list[bool], list[int]]:
+    """Returns, for each stephanus ordinal, whether it is strictly within the range of the work in its row (or True if
+    it has no row, -1), and the index in the table's WorkRangeIndex of the first work which ends after it."""
+    starts, ends = get_work_ranges()
+    index_ends = get_moralia_table().work_index.ends
+    np = get_numpy() if ordinals else None
+
+    if np is None:
+        in_range = [row == -1 or starts[row] < ordinal < ends[row] for ordinal, row in zip(ordinals, rows)]
+        return in_range, [bisect_right(index_ends, ordinal) for ordinal in ordinals]
+
+    ordinals = np.array(ordinals, dtype=np.int64)
+    rows = np.array(rows, dtype=np.int64)
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+
+    # a row of -1 selects the last work, but is in range regardless
+    in_range = (rows == -1) | ((starts[rows] < ordinals) & (ordinals < ends[rows]))
+    work_indexes = np.searchsorted(np.array(index_ends, dtype=np.int64), ordinals, side="right")
+
+    return in_range.tolist(), work_indexes.tolist()
+
+def amend_moralia_bibl(bibl: etree.Element, check: BiblCheck, annotations: Annotations | dict=None, amendments_counter: Counter=None, change_log: list[dict]=None) -> bool:
+    """Amends the <bibl> element as worked out by check_moralia_bibls, and adds a <title> if it needs one. Returns True if
+    it was amended."""
+    if annotations is None:
+        annotations = {}
 
-def process_moralia_bibl(bibl: etree.Element) -> bool:
-    """Tests various aspects of the <bibl> element and amends as necessary."""
-    old_bibl = deepcopy(bibl)
-    
     amendments = {
-        "n_stephanus_doesnt_match": False,
+        "n_stephanus_doesnt_match": check.n_stephanus_doesnt_match,
         "n_stephanus_not_in_work_range": False,
         "title_element_abbrev_incorrect": False,
         "title_element_needed_post_author": False,
         "title_element_needed_no_author": False,
     }
 
-    n_attribute = bibl.attrib["n"]
-    n_author, n_work, n_stephanus = parse_n_attribute(n_attribute)
-    n_work = int(n_work)
-    
-    # Does the "n" attribute's stephanus match the one in the text?
-    bibl_text = "".join(bibl.itertext())
-    re_stephanus = r"\b([1-9]\d{0,3}[a-f])\b"
-    text_stephanus = re.search(re_stephanus, bibl_text).group()
-
-    if n_stephanus != text_stephanus:
-        n_stephanus = text_stephanus
-        bibl.attrib["n"] = f"Perseus:abo:tlg,{n_author},{n_work:03d}:{n_stephanus}"
-        amendments["n_stephanus_doesnt_match"] = True
-    
-    # Is the "n" attribute's stephanus within the work's stephanus range?
-    df_work = get_moralia_info(n_work, n_author)
-    
-    if df_work.empty:
+    if check.new_n_attribute != check.n_attribute:
+        bibl.attrib["n"] = check.new_n_attribute
+
+    moralia_work = check.moralia_work
+
+    if moralia_work is None:
         # no matching author/work
         #TODO: how to handle this?
         return False
 
-    n_start, n_end = get_stephanus_range(df_work)
-
-    if not is_between(n_stephanus, n_start, n_end):
-        n_author, n_work, n_abbreviation = get_tlg_reference(n_stephanus, moralia_abbreviations)
-        bibl.attrib["n"] = f"Perseus:abo:tlg,{n_author:04},{n_work:03}:{n_stephanus}"
-        amendments["n_stephanus_not_in_work_range"] = True
+    amendments["n_stephanus_not_in_work_range"] = check.n_stephanus_not_in_work_range
 
     # Test title element
     # Is the abbreviation in <title> correct?
     title_element = bibl.find("title")
+    new_title = None
 
-    try:
-        n_abbreviation = df_work["abbreviation"].iloc[0]
-    except NameError:
-        pass
+    n_abbreviation = moralia_work.abbreviation
     
     if title_element is not None:
         title = title_element.text
@@ -94,14 +222,18 @@ def process_moralia_bibl(bibl: etree.Element) -> bool:
 
         if n_abbreviation != title:
             title_element.text = f"[{n_abbreviation}]"
+            new_title = title_element.text
             amendments["title_element_abbrev_incorrect"] = True
 
     else:
-        previous_title = get_previous_tag("title", bibl, "div2")
+        title_annotations = get_title_annotations(bibl, annotations)
+        previous_title = title_annotations.previous_title(bibl)
 
         if previous_title is None or previous_title.text != f"[{n_abbreviation}]":
             new_title_element = etree.SubElement(bibl, "title")
             new_title_element.text = f"[{n_abbreviation}]"    
+            title_annotations.insert([new_title_element])
+            new_title = new_title_element.text
 
             author_element = bibl.find("author")
             if author_element is not None:
@@ -115,10 +247,24 @@ def process_moralia_bibl(bibl: etree.Element) -> bool:
                 bibl.text = ""
                 amendments["title_element_needed_no_author"] = True
 
-    for k, v in amendments.items():
-        if v:
-            # etree_print(old_bibl)
-            # etree_print(bibl)
-            return True
-    
-    return False    
\ No newline at end of file
+    if amendments_counter is not None:
+        amendments_counter.update(k for k, v in amendments.items() if v)
+
+    if change_log is not None and any(amendments.values()):
+        change_log.append(make_change_record("amend", bibl, check.n_attribute, amendments, new_title))
+
+    return any(amendments.values())
+
+def get_title_annotations(bibl: etree.Element, annotations: Annotations | dict) -> Annotations:
+    """Return the annotations in which a <bibl>'s previous title is sought: those of the tree, if 'annotations' are
+    they, or else those of the part of the entry in which it is sought, which are made once and kept in the dict
+    'annotations'."""
+    if isinstance(annotations, Annotations):
+        return annotations
+
+    scope = get_search_scope(bibl, "div2")
+
+    if scope not in annotations:
+        annotations[scope] = annotate(scope, tails=False)
+
+    return annotations[scope]
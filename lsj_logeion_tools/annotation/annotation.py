@@ -0,0 +1,221 @@
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from operator import itemgetter
+from lxml import etree
+from utilities.utilities import get_search_scope
+
+class Annotations:
+    """The context of each node of a tree, found in a single traversal (see annotate): the author in force at the node
+    and at its tail, whether its tail is within a <bibl>, and the nearest <title> before it.
+
+    The author in force is the text of the last <author> element other than "Id.", so that each "Id." resolves to its
+    antecedent. Each node is keyed by its position in document order; nodes inserted after the tree was annotated (see
+    insert) are given positions between those of their neighbours. Authors, <bibl> elements and <title> elements are
+    recorded only where they occur, and found by bisection.
+    """
+    __slots__ = (
+        "positions", "initial_author", "author_positions", "author_texts", "bibls", "titles", "tail_order", "tail_authors",
+        "tail_inside_bibl",
+    )
+
+    def __init__(self, initial_author: str=None):
+        self.positions = {}
+        self.initial_author = initial_author
+
+        # the <author> elements other than "Id.", in document order
+        self.author_positions = []
+        self.author_texts = []
+
+        self.bibls = PositionTable()
+        self.titles = PositionTable()
+
+        # the nodes of the tree as it was annotated, in the order in which their tails are reached, with the author in
+        # force at each tail and whether each is within a <bibl>
+        self.tail_order = []
+        self.tail_authors = []
+        self.tail_inside_bibl = []
+
+    def author(self, node: etree.Element) -> str | None:
+        """Return the author in force at 'node': its own text if it is an <author> other than "Id."."""
+        return self.author_at(self.positions[node])
+
+    def author_at(self, position: float) -> str | None:
+        index = bisect_right(self.author_positions, position)
+
+        return self.author_texts[index - 1] if index else self.initial_author
+
+    def previous_title(self, element: etree.Element, search_top: str="div2") -> etree.Element | None:
+        """Return the last <title> before 'element' within its search scope (see get_search_scope), or None.
+
+        Equivalent to get_previous_tag("title", element, search_top).
+        """
+        scope_position = self.positions.get(get_search_scope(element, search_top), float("-inf"))
+        title = self.titles.previous(self.positions[element])
+
+        if title is None or title[0] <= scope_position:
+            return None
+
+        return title[1]
+
+    def insert(self, new_nodes: list[etree.Element]) -> None:
+        """Record nodes which have been inserted next to each other in the tree since it was annotated, with their
+        descendants. They are not added to the tails.
+
+        The nodes must not change the author in force anywhere, i.e. they must not be or contain <author> elements other
+        than "Id.".
+        """
+        previous = new_nodes[0].getprevious()
+
+        if previous is None:
+            previous = new_nodes[0].getparent()
+        else:
+            # the last node before the new nodes is the last descendant of the node before them
+            while len(previous):
+                previous = previous[-1]
+
+        following = get_following(new_nodes[-1])
+        start = self.positions[previous]
+        end = self.positions.get(following, start + 1)
+
+        # the new nodes are spaced evenly between their neighbours
+        nodes = [node for new_node in new_nodes for node in new_node.iter()]
+        step = (end - start) / (len(nodes) + 1)
+
+        for number, node in enumerate(nodes, 1):
+            position = self.positions[node] = start + step * number
+
+            if node.tag == "title":
+                self.titles.add(position, node)
+
+            elif node.tag == "bibl":
+                self.bibls.add(position, node)
+
+def annotate(root: etree.Element, last_author: dict=None, tails: bool=True) -> Annotations:
+    """Annotate each node of 'root' in a single traversal.
+
+    last_author optionally carries the author in force from one call to the next, e.g. between the entries of a file:
+    it gives the author in force before 'root', and is set to the author in force at its end. If 'tails' is False, the
+    tails of the nodes, which only the add stage needs, are not recorded.
+    """
+    author = None if last_author is None else last_author["author"]
+    annotations = Annotations(author)
+    positions = annotations.positions
+    author_positions = annotations.author_positions
+    author_texts = annotations.author_texts
+    # the first run of the <bibl> and <title> elements
+    bibl_positions, bibl_elements = [], []
+    title_positions, title_elements = [], []
+    tail_order = annotations.tail_order
+    tail_authors = annotations.tail_authors
+    tail_inside_bibl = annotations.tail_inside_bibl
+
+    # the ancestors of the current node within the root, whose tails are still to come, and how many are <bibl> elements
+    open_nodes = []
+    bibl_depth = sum(1 for ancestor in root.iterancestors() if ancestor.tag == "bibl")
+
+    for position, node in enumerate(root.iter()):
+        positions[node] = position
+        tag = node.tag
+
+        if tails:
+            parent = node.getparent()
+
+            # the tail of a node comes after all of its descendants, so a node is closed when the next node is not one
+            while open_nodes and open_nodes[-1] is not parent:
+                closed = open_nodes.pop()
+
+                if closed.tag == "bibl":
+                    bibl_depth -= 1
+
+                tail_order.append(closed)
+                tail_authors.append(author)
+                tail_inside_bibl.append(bibl_depth > 0)
+
+            open_nodes.append(node)
+
+            if tag == "bibl":
+                bibl_depth += 1
+
+        if tag == "author":
+            if node.text != "Id.":
+                author = node.text
+                author_positions.append(position)
+                author_texts.append(author)
+
+        elif tag == "title":
+            title_positions.append(position)
+            title_elements.append(node)
+
+        elif tag == "bibl":
+            bibl_positions.append(position)
+            bibl_elements.append(node)
+
+    for closed in reversed(open_nodes):
+        if closed.tag == "bibl":
+            bibl_depth -= 1
+
+        tail_order.append(closed)
+        tail_authors.append(author)
+        tail_inside_bibl.append(bibl_depth > 0)
+
+    if bibl_positions:
+        annotations.bibls.runs.append((bibl_positions, bibl_elements))
+
+    if title_positions:
+        annotations.titles.runs.append((title_positions, title_elements))
+
+    if last_author is not None:
+        last_author["author"] = author
+
+    return annotations
+
+class PositionTable:
+    """Values by position in document order, e.g. the <title> elements of a tree, for the last value before any position.
+
+    The values are kept in runs of ascending position. A value which comes after the last run is added to it; any other
+    starts a new run. The tree and each stage add their values in document order, so there are few runs, and adding a
+    value never moves the others.
+    """
+    __slots__ = ("runs",)
+
+    def __init__(self):
+        self.runs = []
+
+    def add(self, position: float, value) -> None:
+        if not self.runs or position < self.runs[-1][0][-1]:
+            self.runs.append(([], []))
+
+        positions, values = self.runs[-1]
+        positions.append(position)
+        values.append(value)
+
+    def previous(self, position: float) -> tuple[float, object] | None:
+        """Return the last position before 'position' and its value, or None."""
+        previous = None
+
+        for positions, values in self.runs:
+            index = bisect_left(positions, position)
+
+            if index and (previous is None or positions[index - 1] > previous[0]):
+                previous = (positions[index - 1], values[index - 1])
+
+        return previous
+
+    def values(self) -> list:
+        """Return the values in document order."""
+        if len(self.runs) == 1:
+            return list(self.runs[0][1])
+
+        return [value for _, value in merge(*(zip(*run) for run in self.runs), key=itemgetter(0))]
+
+def get_following(node: etree.Element) -> etree.Element | None:
+    """Return the first node after 'node' and its descendants in document order, or None."""
+    while node is not None:
+        following = node.getnext()
+
+        if following is not None:
+            return following
+
+        node = node.getparent()
+
+    return None
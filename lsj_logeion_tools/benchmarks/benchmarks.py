@@ -0,0 +1,151 @@
+import argparse, contextlib, io, json, os, platform, statistics, sys, tempfile, time
+from copy import deepcopy
+from lxml import etree
+from benchmarks.corpus_generator import generate_corpus
+from pipeline.pipeline import parse_stages
+from processing.processing import process_file
+from utilities.utilities import clean_stephanus, find_references, get_moralia_table, get_tlg_reference, has_reference, max_plutarch_ordinal, re_reference, stephanus_ordinal
+from amend_moralia_references.amend_moralia_references import get_moralia_bibls, process_moralia_bibl
+
+benchmark_modes = ["id", "add", "amend", "all"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each mode of main.py and the hot helpers on a synthetic corpus.")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--entries", type=int, default=2000, help="entries per file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plutarch", type=float, default=0.5, help="the share of citations which are of Plutarch")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each benchmark")
+    parser.add_argument("--output", help="file to write the JSON results to; by default they are printed")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.files, arguments.entries, arguments.seed, arguments.repeat, arguments.plutarch)
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    if arguments.compare:
+        with open(arguments.compare, "r", encoding="utf-8") as f:
+            print_comparison(json.load(f), results, file=sys.stderr)
+
+def run_benchmarks(files: int, entries: int, seed: int, repeat: int, plutarch: float=0.5) -> dict:
+    """Generate a corpus and time each mode and helper on it. Returns the results as a JSON-serialisable dict."""
+    results = {
+        "metadata": {
+            "files": files,
+            "entries": entries,
+            "seed": seed,
+            "plutarch": plutarch,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "lxml": ".".join(str(n) for n in etree.LXML_VERSION),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory() as corpus_path:
+        file_names = generate_corpus(corpus_path, files, entries, seed, plutarch)
+
+        results["benchmarks"].update(time_modes(corpus_path, file_names, repeat, files * entries))
+        results["benchmarks"].update(time_helpers(corpus_path, file_names, repeat))
+
+    return results
+
+def time_modes(corpus_path: str, file_names: list[str], repeat: int, entries: int) -> dict:
+    """Time process_file over the whole corpus for each mode, with and without the prefilter."""
+    results = {}
+
+    for mode in benchmark_modes:
+        stages = parse_stages(mode)
+
+        for prefilter in (False, True):
+            with tempfile.TemporaryDirectory() as destination:
+
+                def run():
+                    # the per-file and per-element console output is not part of the benchmark
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for file in file_names:
+                            process_file(file, stages, corpus_path + os.sep, destination + os.sep, prefilter=prefilter)
+
+                results[f"mode:{mode}:prefilter" if prefilter else f"mode:{mode}"] = summarise(time_repeated(run, repeat), entries)
+
+    return results
+
+def time_helpers(corpus_path: str, file_names: list[str], repeat: int) -> dict:
+    """Time the helpers called for each element, tail or reference, on inputs taken from the corpus."""
+    roots = [etree.parse(os.path.join(corpus_path, file)).getroot() for file in file_names]
+
+    tails = [element.tail for root in roots for element in root.iter() if element.tail]
+    raw_references = [match[0] for tail in tails for match in re_reference.finditer(tail)]
+    stephanus_references = [clean_stephanus(raw) for raw in raw_references]
+    stephanus_references = [s for s in stephanus_references if stephanus_ordinal(s) <= max_plutarch_ordinal]
+    work_index = get_moralia_table().work_index
+
+    results = {
+        "has_reference": summarise(time_repeated(lambda: [has_reference(tail) for tail in tails], repeat), len(tails)),
+        "find_references": summarise(time_repeated(lambda: [find_references(tail) for tail in tails], repeat), len(tails)),
+        "clean_stephanus": summarise(time_repeated(lambda: [clean_stephanus(raw) for raw in raw_references], repeat), len(raw_references)),
+        "get_tlg_reference": summarise(time_repeated(lambda: [get_tlg_reference(s, work_index) for s in stephanus_references], repeat), len(stephanus_references)),
+    }
+
+    # process_moralia_bibl amends the tree, so each run works on a fresh copy
+    times = []
+    bibls_counter = 0
+
+    for _ in range(repeat):
+        copies = [deepcopy(root) for root in roots]
+        bibls = [bibl for root in copies for bibl in get_moralia_bibls(root)]
+        bibls_counter = len(bibls)
+        annotations = {}
+
+        start = time.perf_counter()
+        for bibl in bibls:
+            process_moralia_bibl(bibl, annotations)
+        times.append(time.perf_counter() - start)
+
+    results["process_moralia_bibl"] = summarise(times, bibls_counter)
+
+    return results
+
+def time_repeated(function, repeat: int) -> list[float]:
+    """Return the wall time in seconds of each of 'repeat' calls of 'function'."""
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def summarise(times: list[float], items: int) -> dict:
+    """Return the timings of a benchmark, with the number of items (entries, tails, references...) processed per run."""
+    best = min(times)
+
+    return {
+        "seconds": times,
+        "min": best,
+        "median": statistics.median(times),
+        "items": items,
+        "items_per_second": items / best if best else None,
+    }
+
+def print_comparison(old_results: dict, new_results: dict, file=sys.stdout) -> None:
+    """Print the change in the best time of each benchmark found in both sets of results."""
+    for name, new in new_results["benchmarks"].items():
+        old = old_results["benchmarks"].get(name)
+
+        if old is None or not new["min"]:
+            continue
+
+        print(f"{name}: {old['min']:.4f}s -> {new['min']:.4f}s ({old['min'] / new['min']:.2f}x)", file=file)
+
+if __name__ == "__main__":
+    main()
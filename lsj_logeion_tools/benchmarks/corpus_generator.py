@@ -0,0 +1,159 @@
+import argparse, os, random
+from xml.sax.saxutils import escape
+from utilities.utilities import MoraliaWork, Stephanus, get_moralia_table
+
+# Other authors cited in LSJ, with a typical form of reference; none of them is Plutarch
+other_authors = [("Hom.", "Il. {book}.{line}"), ("Hdt.", "{book}.{line}"), ("Th.", "{book}.{line}"), ("Pl.", "R. {line}e"), ("Ar.", "Av. {line}")]
+
+greek_letters = "αβγδεζηθικλμνξοπρστυφχψω"
+
+def generate_corpus(path: str, files: int=2, entries: int=500, seed: int=0, plutarch: float=0.5) -> list[str]:
+    """Write 'files' greatscott-style XML files of 'entries' entries each to the folder 'path'.
+
+    'plutarch' is the share of citations which are of Plutarch, half unwrapped and half existing <bibl> elements. The
+    same seed always produces the same corpus. Returns the names of the files written.
+    """
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+
+    file_names = []
+
+    for file_number in range(1, files + 1):
+        file_name = f"greatscott{file_number:02d}.xml"
+
+        with open(os.path.join(path, file_name), "w", encoding="utf-8") as f:
+            f.write(generate_file(rng, file_number, entries, plutarch))
+
+        file_names.append(file_name)
+
+    return file_names
+
+def generate_file(rng: random.Random, file_number: int, entries: int, plutarch: float=0.5) -> str:
+    """Return the XML of one greatscott file."""
+    letter = greek_letters[(file_number - 1) % len(greek_letters)]
+
+    parts = [
+        '<TEI.2><teiHeader><fileDesc><titleStmt><title>A Greek-English Lexicon</title></titleStmt></fileDesc></teiHeader>',
+        f'<text><body><div1 type="alphabetic letter" n="{letter}"><head>{letter.upper()}</head>\n',
+    ]
+
+    for entry_number in range(entries):
+        parts.append(generate_entry(rng, f"n{file_number}.{entry_number}", letter, plutarch))
+        parts.append("\n")
+
+    parts.append("</div1></body></text></TEI.2>")
+
+    return "".join(parts)
+
+def generate_entry(rng: random.Random, entry_id: str, letter: str, plutarch: float=0.5) -> str:
+    """Return the XML of one <div2> entry, with a random mixture of senses and citations."""
+    headword = letter + "".join(rng.choice(greek_letters) for _ in range(rng.randint(2, 8)))
+
+    parts = [
+        f'<div2 id="{entry_id}" key="{headword}" type="main">',
+        f'<head extent="full" lang="greek" opt="n">{headword}</head>, <gen lang="greek">ἡ</gen>, ',
+    ]
+
+    for sense_number in range(rng.randint(1, 4)):
+        parts.append(f'<sense id="{entry_id}.{sense_number}" n="{"ABCD"[sense_number]}" level="1" opt="n">')
+        parts.append(f'<tr opt="n">{escape(rng.choice(["meaning", "sense", "use"]))}</tr>, ')
+
+        for _ in range(rng.randint(0, 5)):
+            parts.append(generate_citation(rng, plutarch))
+
+        parts.append("</sense>")
+
+    parts.append("</div2>")
+
+    return "".join(parts)
+
+def generate_citation(rng: random.Random, plutarch: float=0.5) -> str:
+    """Return one citation: another author, an unwrapped Plutarch reference, an existing Moralia <bibl>, or an
+    inscription. 'plutarch' is the share of citations which are of Plutarch."""
+    kind = rng.random()
+
+    if kind < 0.95 - plutarch:
+        author, reference = rng.choice(other_authors)
+        reference = reference.format(book=rng.randint(1, 24), line=rng.randint(1, 500))
+        citation = f'<bibl n="Perseus:abo:tlg,0000,001:1"><author>{author}</author> {reference}</bibl>'
+
+        # "Id." refers back to an author which is not Plutarch
+        if rng.random() < 0.2:
+            citation += f", Id. {rng.randint(1, 24)}.{rng.randint(1, 500)}"
+
+        return citation + "; "
+
+    if kind < 0.95 - plutarch / 2:
+        # Plutarch, with bare Stephanus and Wyttenbach references in the tail
+        references = [random_reference(rng, wyttenbach=i == 0 and rng.random() < 0.7) for i in range(rng.randint(1, 3))]
+        citation = f"<author>Plu.</author> {', '.join(references)}"
+
+        if rng.random() < 0.3:
+            citation += f"; Id. {random_reference(rng, wyttenbach=rng.random() < 0.5)}"
+
+        return citation + "; "
+
+    if kind < 0.95:
+        return generate_moralia_bibl(rng) + "; "
+
+    # inscriptions have stephanus-like references in the text of a <title>
+    return f"<title>IG</title> {rng.randint(1, 12)}{rng.choice('abcdef')}; "
+
+def generate_moralia_bibl(rng: random.Random) -> str:
+    """Return an existing Moralia <bibl>, sometimes with a mismatched "n" attribute or a missing or incorrect title."""
+    table = get_moralia_table()
+    moralia_work = rng.choice(table.works)
+    stephanus = random_stephanus(rng, moralia_work)
+
+    n_work = moralia_work
+    n_stephanus = stephanus
+    fault = rng.random()
+
+    if fault < 0.1:
+        n_stephanus = random_stephanus(rng, moralia_work)
+    elif fault < 0.2:
+        n_work = rng.choice(table.works)
+
+    n_attribute = f"Perseus:abo:tlg,{n_work.author:04d},{n_work.work:03d}:{n_stephanus}"
+
+    title = rng.random()
+
+    if title < 0.4:
+        title_element = f"<title>{escape(moralia_work.abbreviation)}</title> "
+    elif title < 0.5:
+        title_element = f"<title>{escape(rng.choice(table.works).abbreviation)}</title> "
+    else:
+        title_element = ""
+
+    reference = f"2.{stephanus}" if rng.random() < 0.7 else stephanus
+
+    if rng.random() < 0.8:
+        return f'<bibl n="{n_attribute}"><author>Plu.</author> {title_element}{reference}</bibl>'
+
+    return f'<bibl n="{n_attribute}">{title_element}{reference}</bibl>'
+
+def random_stephanus(rng: random.Random, moralia_work: MoraliaWork) -> str:
+    """Return a random stephanus reference from the start of a work up to, but not including, its end."""
+    start = Stephanus.from_string(moralia_work.start).ordinal
+    end = Stephanus.from_string(moralia_work.end).ordinal
+    return str(Stephanus(rng.randrange(start, end)))
+
+def random_reference(rng: random.Random, wyttenbach: bool) -> str:
+    """Return a random reference to the Moralia, in Wyttenbach (2.123a) or Stephanus (123a) form."""
+    stephanus = random_stephanus(rng, rng.choice(get_moralia_table().works))
+    return f"2.{stephanus}" if wyttenbach else stephanus
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of greatscott-style XML files.")
+    parser.add_argument("destination")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--entries", type=int, default=500, help="entries per file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plutarch", type=float, default=0.5, help="the share of citations which are of Plutarch")
+    arguments = parser.parse_args()
+
+    for file_name in generate_corpus(arguments.destination, arguments.files, arguments.entries, arguments.seed, arguments.plutarch):
+        print(file_name)
+
+if __name__ == "__main__":
+    main()
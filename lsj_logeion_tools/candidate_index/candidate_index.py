@@ -0,0 +1,180 @@
+import hashlib, os, sqlite3
+from contextlib import closing
+from typing import NamedTuple
+from lxml import etree
+from annotation.annotation import annotate
+from resolvers.resolvers import resolvers
+
+# The candidate index records, for each source file by hash, which of its entries the add and amend stages could change.
+# The candidates depend on the registered resolvers too, so each file is indexed under its hash and a digest of them
+# (see get_index_key).
+index_name = ".lsj_candidates.sqlite"
+
+# Files indexed by an older version of scan_entry are indexed again
+index_version = 2
+
+class EntryCandidates(NamedTuple):
+    """What the add and amend stages look for in an entry. Only entries with at least one of these are indexed."""
+    position: int
+    incoming_author: str | None # the last <author> before the entry, other than "Id."
+    has_resolver_author: bool # an <author> with a registered resolver
+    has_stephanus: bool # anything like a reference to such an author in any text of the entry, or its tail
+    has_moralia_bibl: bool # a <bibl> whose "n" attribute may refer to Plutarch
+
+    def is_candidate(self, stages: list[str]) -> bool:
+        """Returns True if any of the stages could change the entry. Entries which are not candidates are left as they are."""
+        references = self.has_stephanus and (self.has_resolver_author or self.incoming_author in resolvers)
+
+        # references wrapped by the add stage are amended as well, so they need no separate test
+        return ("add" in stages and references) or ("amend" in stages and self.has_moralia_bibl)
+
+class FileCandidates(NamedTuple):
+    entries: int
+    # whether there are authors, references or <bibl> elements outside the entries, or None if that is not known
+    outside: bool | None
+    candidates: dict[int, EntryCandidates]
+
+def scan_entry(entry: etree.Element, position: int, incoming_author: str | None) -> tuple[EntryCandidates, str | None]:
+    """Returns the candidates of an entry and the author in force at its end (see annotate), which is the incoming author
+    of the next entry."""
+    last_author = {"author": incoming_author}
+    annotations = annotate(entry, last_author, tails=False)
+    # "Id." has no resolver, so the authors other than "Id." are enough
+    has_resolver_author = any(author in resolvers for author in annotations.author_texts)
+
+    text = "\n".join(entry.itertext()) + "\n" + (entry.tail or "")
+    has_stephanus = has_possible_reference(text)
+
+    has_moralia_bibl = any(is_moralia_n_attribute(bibl.get("n")) for bibl in annotations.bibls.values())
+
+    return EntryCandidates(position, incoming_author, has_resolver_author, has_stephanus, has_moralia_bibl), last_author["author"]
+
+def has_possible_reference(text: str) -> bool:
+    """Returns True if the text contains anything like a reference to an author with a registered resolver."""
+    return any(resolver.pattern.search(text) for resolver in resolvers.values())
+
+def is_moralia_n_attribute(n_attribute: str | None) -> bool:
+    return n_attribute is not None and ("tlg,0007," in n_attribute or "tlg,0094," in n_attribute)
+
+def scan_file(root: etree.Element, entry_tag: str="div2") -> FileCandidates:
+    """Returns the candidates of every entry in a file."""
+    candidates = {}
+    last_author = None
+    entries = 0
+
+    for position, entry in enumerate(root.iter(entry_tag)):
+        entry_candidates, last_author = scan_entry(entry, position, last_author)
+        entries += 1
+
+        if any(entry_candidates[2:]):
+            candidates[position] = entry_candidates
+
+    return FileCandidates(entries, has_outside_content(root, entry_tag), candidates)
+
+def has_outside_content(root: etree.Element, entry_tag: str="div2") -> bool:
+    """Returns True if there are any <author> or <bibl> elements or stephanus-like references outside the entries."""
+    stack = [root]
+
+    while stack:
+        element = stack.pop()
+
+        # the tails of entries are scanned with the entries themselves
+        if element.tag == entry_tag:
+            continue
+
+        if element.tag in ("author", "bibl"):
+            return True
+
+        text = "\n".join([element.text or "", element.tail or ""])
+
+        if has_possible_reference(text):
+            return True
+
+        stack.extend(element)
+
+    return False
+
+def select_entries(root: etree.Element, file_candidates: FileCandidates, stages: list[str], entry_tag: str="div2") -> list[tuple[etree.Element, str | None]] | None:
+    """Returns each entry in 'root' which the stages could change, with its incoming author.
+
+    Returns None if the stages must be run on the whole file instead, because there is something to change outside the
+    entries, or the index does not match the file.
+    """
+    if file_candidates.outside is not False:
+        return None
+
+    entries = list(root.iter(entry_tag))
+
+    if len(entries) != file_candidates.entries:
+        return None
+
+    return [(entries[c.position], c.incoming_author) for c in file_candidates.candidates.values() if c.is_candidate(stages)]
+
+def open_index(path_to: str) -> sqlite3.Connection:
+    """Open the candidate index in the destination folder 'path_to', creating it if necessary."""
+    connection = sqlite3.connect(os.path.join(path_to, index_name), timeout=60)
+
+    with connection:
+        # an index made by another version is started again
+        if connection.execute("PRAGMA user_version").fetchone()[0] != index_version:
+            connection.execute("DROP TABLE IF EXISTS files")
+            connection.execute("DROP TABLE IF EXISTS entries")
+            connection.execute(f"PRAGMA user_version = {index_version}")
+
+        connection.execute("CREATE TABLE IF NOT EXISTS files (file_hash TEXT PRIMARY KEY, entries INTEGER, outside INTEGER)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (file_hash TEXT, position INTEGER, incoming_author TEXT, has_resolver_author INTEGER, "
+            "has_stephanus INTEGER, has_moralia_bibl INTEGER, PRIMARY KEY (file_hash, position))"
+        )
+
+    return connection
+
+def get_index_key(file_hash: str) -> str:
+    """Returns the key of the file with the hash 'file_hash' in the index: its hash and a digest of the authors and
+    patterns of the registered resolvers, so that a file is indexed again when a resolver is registered or changed."""
+    resolvers_hash = hashlib.sha256()
+
+    for author, resolver in sorted(resolvers.items()):
+        resolvers_hash.update(f"{author}\t{resolver.pattern.pattern}\n".encode("utf-8"))
+
+    return f"{file_hash}:{resolvers_hash.hexdigest()}"
+
+def load_candidates(connection: sqlite3.Connection, file_hash: str) -> FileCandidates | None:
+    """Returns the candidates of the file with the hash 'file_hash', or None if it has not been indexed with the
+    resolvers which are registered now."""
+    file_hash = get_index_key(file_hash)
+    row = connection.execute("SELECT entries, outside FROM files WHERE file_hash = ?", (file_hash,)).fetchone()
+
+    if row is None:
+        return None
+
+    entries, outside = row
+    rows = connection.execute(
+        "SELECT position, incoming_author, has_resolver_author, has_stephanus, has_moralia_bibl FROM entries WHERE file_hash = ?", (file_hash,)
+    )
+    candidates = {position: EntryCandidates(position, author, bool(a), bool(b), bool(c)) for position, author, a, b, c in rows}
+
+    return FileCandidates(entries, None if outside is None else bool(outside), candidates)
+
+def save_candidates(connection: sqlite3.Connection, file_hash: str, file_candidates: FileCandidates) -> None:
+    """Save the candidates of the file with the hash 'file_hash', replacing any older index of it."""
+    file_hash = get_index_key(file_hash)
+
+    with connection:
+        connection.execute("DELETE FROM entries WHERE file_hash = ?", (file_hash,))
+        connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (file_hash, file_candidates.entries, file_candidates.outside)
+        )
+        connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", [(file_hash, *c) for c in file_candidates.candidates.values()])
+
+def get_file_candidates(path_to: str, file_hash: str, root: etree.Element) -> FileCandidates:
+    """Returns the candidates of a parsed file, from the index if the file has been indexed by a whole-file run, or by
+    scanning it and saving them to the index if not."""
+    with closing(open_index(path_to)) as connection:
+        file_candidates = load_candidates(connection, file_hash)
+
+        if file_candidates is None or file_candidates.outside is None:
+            file_candidates = scan_file(root)
+            save_candidates(connection, file_hash, file_candidates)
+
+    return file_candidates
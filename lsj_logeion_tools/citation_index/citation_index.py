@@ -0,0 +1,164 @@
+import argparse, os, sqlite3, sys, time
+from contextlib import closing
+from typing import NamedTuple
+from amend_moralia_references.amend_moralia_references import get_moralia_bibls
+from file_io.file_io import default_destination, folder, load_xml_files, read_xml
+from manifest.manifest import hash_file
+from utilities.utilities import get_headword, get_moralia_table, parse_n_attribute, stephanus_ordinal
+
+# The citation index records every Moralia <bibl> in a folder of greatscott files, for queries by work and stephanus
+index_name = ".lsj_citations.sqlite"
+
+# An index made by another version is built again
+index_version = 1
+
+class Citation(NamedTuple):
+    file: str
+    headword: str | None
+    author: int
+    work: int
+    stephanus: str
+    ordinal: int
+
+def open_citation_index(index_path: str) -> sqlite3.Connection:
+    """Open the citation index at 'index_path', creating it if necessary."""
+    connection = sqlite3.connect(index_path, timeout=60)
+
+    with connection:
+        if connection.execute("PRAGMA user_version").fetchone()[0] != index_version:
+            connection.execute("DROP TABLE IF EXISTS files")
+            connection.execute("DROP TABLE IF EXISTS citations")
+            connection.execute(f"PRAGMA user_version = {index_version}")
+
+        connection.execute("CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, file_hash TEXT)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS citations (file TEXT, headword TEXT, author INTEGER, work INTEGER, stephanus TEXT, ordinal INTEGER)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS citations_by_ordinal ON citations (ordinal)")
+        connection.execute("CREATE INDEX IF NOT EXISTS citations_by_work ON citations (work, ordinal)")
+        connection.execute("CREATE INDEX IF NOT EXISTS citations_by_file ON citations (file)")
+
+    return connection
+
+def get_citations(file: str, path: str) -> list[Citation]:
+    """Returns every Moralia <bibl> in a file, in document order."""
+    root = read_xml(os.path.join(path, file))
+    citations = []
+
+    for bibl in get_moralia_bibls(root):
+        author, work, stephanus = parse_n_attribute(bibl.get("n"))
+        citations.append(Citation(file, get_headword(bibl), int(author), int(work), stephanus, stephanus_ordinal(stephanus)))
+
+    return citations
+
+def update_citation_index(connection: sqlite3.Connection, path: str) -> tuple[int, int]:
+    """Bring the index up to date with the greatscott files in 'path'. Only files which are new or have changed since
+    they were indexed are read; files which are no longer in 'path' are removed from the index.
+
+    Returns the number of files indexed and removed.
+    """
+    files = load_xml_files(path)
+    indexed = dict(connection.execute("SELECT file, file_hash FROM files"))
+    files_indexed = 0
+
+    for file in files:
+        file_hash = hash_file(os.path.join(path, file))
+
+        if indexed.get(file) == file_hash:
+            continue
+
+        citations = get_citations(file, path)
+
+        with connection:
+            connection.execute("DELETE FROM citations WHERE file = ?", (file,))
+            connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?)", (file, file_hash))
+            connection.executemany("INSERT INTO citations VALUES (?, ?, ?, ?, ?, ?)", citations)
+
+        files_indexed += 1
+
+    removed = [file for file in indexed if file not in files]
+
+    with connection:
+        for file in removed:
+            connection.execute("DELETE FROM citations WHERE file = ?", (file,))
+            connection.execute("DELETE FROM files WHERE file = ?", (file,))
+
+    return files_indexed, len(removed)
+
+def query_citations(connection: sqlite3.Connection, work: int=None, start: str=None, end: str=None) -> list[Citation]:
+    """Returns the citations of a work, of a stephanus range (from 'start' to 'end', inclusive), or both, in stephanus
+    order."""
+    conditions = []
+    parameters = []
+
+    if work is not None:
+        conditions.append("work = ?")
+        parameters.append(work)
+
+    for bound, operator in ((start, ">="), (end, "<=")):
+        if bound is None:
+            continue
+
+        ordinal = stephanus_ordinal(bound)
+
+        if ordinal is None:
+            raise ValueError(f"stephanus ({bound}) is not a clean stephanus reference")
+
+        conditions.append(f"ordinal {operator} ?")
+        parameters.append(ordinal)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = connection.execute(
+        f"SELECT file, headword, author, work, stephanus, ordinal FROM citations {where} ORDER BY ordinal, file, rowid", parameters
+    )
+
+    return [Citation(*row) for row in rows]
+
+def parse_work(work: str) -> int:
+    """Returns the TLG work number of a work given by number (e.g. 89) or by abbreviation (e.g. 'Isid.')."""
+    if work.isdigit():
+        return int(work)
+
+    for moralia_work in get_moralia_table().works:
+        if moralia_work.abbreviation == work:
+            return moralia_work.work
+
+    raise argparse.ArgumentTypeError(f"unknown work '{work}'")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query an index of the Moralia <bibl> elements in the greatscott files.")
+    parser.add_argument("path", nargs="?", type=folder, default=default_destination, help="the folder of greatscott files")
+    parser.add_argument("--index", help=f"the index file; by default {index_name} in the folder")
+    parser.add_argument("--update", action="store_true", help="bring the index up to date with the folder before any query")
+    parser.add_argument("--work", type=parse_work, help="a work, by TLG number or abbreviation")
+    parser.add_argument("--from", dest="start", help="the first stephanus reference of a range, e.g. 351c")
+    parser.add_argument("--to", dest="end", help="the last stephanus reference of a range, e.g. 360f")
+    arguments = parser.parse_args()
+
+    index_path = arguments.index or os.path.join(arguments.path, index_name)
+
+    with closing(open_citation_index(index_path)) as connection:
+        if arguments.update:
+            start = time.perf_counter()
+            files_indexed, files_removed = update_citation_index(connection, arguments.path)
+            print(f"{files_indexed} files indexed, {files_removed} removed in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+        if arguments.work is None and arguments.start is None and arguments.end is None:
+            return
+
+        try:
+            citations = query_citations(connection, arguments.work, arguments.start, arguments.end)
+        except ValueError as e:
+            parser.error(str(e))
+
+    table = get_moralia_table()
+
+    for citation in citations:
+        moralia_work = table.get(citation.author, citation.work)
+        abbreviation = moralia_work.abbreviation if moralia_work else ""
+        print(f"{citation.stephanus}\t{abbreviation}\t{citation.headword or ''}\t{citation.file}")
+
+    print(f"{len(citations)} citations", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse, html, os, re, sqlite3
+from contextlib import closing
+from typing import NamedTuple
+from file_io.file_io import default_destination, default_source, folder, load_xml_files, map_source, open_destination
+
+# The entry index records, for each file, the byte offsets, headword and incoming author of each <div2> entry
+index_name = ".lsj_entries.sqlite"
+
+# An index made by another version is started again
+index_version = 1
+
+# The tokens of a file which the index needs, in document order: the start and end tags of entries, and <author> elements
+# with their text (group 1 is "/" for an empty entry; group 2 is the text of an <author>, up to its first child)
+re_entry_token = re.compile(rb"<div2(?=[\s/>])[^>]*?(/?)>|</div2\s*>|<author(?=[\s/>])[^>]*?(?:/>|>([^<]*))")
+
+# The start and end tags of entries alone, for scans which do not need the authors (group 1 as for re_entry_token)
+re_entry_boundary = re.compile(rb"<div2(?=[\s/>])[^>]*?(/?)>|</div2\s*>")
+
+re_head = re.compile(rb"<head(?=[\s/>])[^>]*?(?:/>|>([^<]*))")
+
+class EntryOffsets(NamedTuple):
+    position: int
+    start: int # the byte offset of the entry's start tag
+    end: int # the byte offset just after its end tag; the entry's tail is not included
+    headword: str | None
+    incoming_author: str | None # the last <author> before the entry, other than "Id."
+
+def scan_entry_offsets(data: bytes) -> list[EntryOffsets]:
+    """Returns the offsets of each entry in the bytes of a file, without parsing it.
+
+    The headword is the text of the entry's first <head> (see get_headword), and the incoming author is the author the
+    add stage would have in force at the start of the entry.
+    """
+    return [make_entry_offsets(data, position, *span) for position, span in enumerate(scan_entry_spans(data))]
+
+def scan_entry_spans(data: bytes, start: int=0, end: int=None, authors: bool=True) -> list[tuple[int, int, str | None]]:
+    """Returns the start and end of each entry in data[start:end], and the last <author> before it other than "Id.", or
+    None for each if 'authors' is False, which is faster.
+
+    Raises ValueError if the entries are nested or not closed.
+    """
+    end = len(data) if end is None else end
+    spans = []
+    entry_start = None
+    incoming_author = None
+    last_author = None
+
+    for match in (re_entry_token if authors else re_entry_boundary).finditer(data, start, end):
+        token = match[0]
+
+        if token.startswith(b"<author"):
+            author = decode_text(match[2])
+
+            if author != "Id.":
+                last_author = author
+
+        elif token.startswith(b"</"):
+            if entry_start is None:
+                raise ValueError(f"unmatched </div2> at byte {match.start()}")
+
+            spans.append((entry_start, match.end(), incoming_author))
+            entry_start = None
+
+        elif entry_start is not None:
+            raise ValueError(f"nested <div2> at byte {match.start()}")
+
+        elif match[1]:
+            spans.append((match.start(), match.end(), last_author))
+
+        else:
+            entry_start = match.start()
+            incoming_author = last_author
+
+    if entry_start is not None:
+        raise ValueError(f"unclosed <div2> at byte {entry_start}")
+
+    return spans
+
+def make_entry_offsets(data: bytes, position: int, start: int, end: int, incoming_author: str | None) -> EntryOffsets:
+    head = re_head.search(data, start, end)
+    headword = decode_text(head[1]) if head else None
+
+    return EntryOffsets(position, start, end, headword, incoming_author)
+
+def decode_text(text: bytes | None) -> str | None:
+    """Returns the text of an element as lxml would: None if it is empty, with character and entity references replaced."""
+    if not text:
+        return None
+
+    text = text.decode("utf-8")
+
+    return html.unescape(text) if "&" in text else text
+
+def open_entry_index(path_to: str=None) -> sqlite3.Connection:
+    """Open the entry index in the destination folder 'path_to', creating it if necessary, or an index in memory if
+    'path_to' is None, e.g. for a dry run."""
+    connection = sqlite3.connect(":memory:" if path_to is None else os.path.join(path_to, index_name), timeout=60)
+
+    with connection:
+        if connection.execute("PRAGMA user_version").fetchone()[0] != index_version:
+            connection.execute("DROP TABLE IF EXISTS files")
+            connection.execute("DROP TABLE IF EXISTS entries")
+            connection.execute(f"PRAGMA user_version = {index_version}")
+
+        connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (path TEXT, position INTEGER, start INTEGER, end INTEGER, headword TEXT, "
+            "incoming_author TEXT, PRIMARY KEY (path, position))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_by_headword ON entries (headword)")
+
+    return connection
+
+def update_entry_index(connection: sqlite3.Connection, path: str) -> bool:
+    """Index the file 'path' if it has not been indexed since it was last changed. Returns True if it was indexed.
+
+    A file is taken to be unchanged if its size and modification time are, so that no file is read to find out.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    row = connection.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+
+    if row == (stat.st_size, stat.st_mtime_ns):
+        return False
+
+    with map_source(path) as data:
+        save_entry_offsets(connection, path, scan_entry_offsets(data))
+
+    return True
+
+def save_entry_offsets(connection: sqlite3.Connection, path: str, entries: list[EntryOffsets]) -> None:
+    """Save the offsets of the entries of the file 'path' as it is now, replacing any older index of it."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    with connection:
+        connection.execute("DELETE FROM entries WHERE path = ?", (path,))
+        connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns))
+        connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", [(path, *entry) for entry in entries])
+
+def splice_entries(connection: sqlite3.Connection, path: str, entries: list[EntryOffsets], new_entries: dict[int, bytes]) -> None:
+    """Replace the bytes of the entries of the file 'path' at the positions in 'new_entries', through open_destination,
+    and save the offsets of its entries as they are afterwards, so that it need not be scanned again.
+
+    'entries' are the offsets of all of the entries of the file as it was.
+    """
+    spliced_entries = []
+    shift = 0
+
+    with map_source(path) as data:
+        with open_destination(path) as f:
+            position = 0
+
+            for entry in entries:
+                if entry.position not in new_entries:
+                    spliced_entries.append(entry._replace(start=entry.start + shift, end=entry.end + shift))
+                    continue
+
+                new_entry = new_entries[entry.position]
+                f.write(data[position:entry.start])
+                f.write(new_entry)
+                position = entry.end
+
+                # the headword of the new entry, at its new offsets
+                spliced_entry = make_entry_offsets(new_entry, entry.position, 0, len(new_entry), entry.incoming_author)
+                spliced_entries.append(spliced_entry._replace(start=entry.start + shift, end=entry.start + shift + len(new_entry)))
+                shift += len(new_entry) - (entry.end - entry.start)
+
+            f.write(data[position:])
+
+    save_entry_offsets(connection, path, spliced_entries)
+
+def load_entry_offsets(connection: sqlite3.Connection, path: str, positions: tuple[int, int]=None) -> list[EntryOffsets]:
+    """Returns the offsets of the entries of an indexed file, in order, or only those from positions[0] to positions[1]."""
+    query = "SELECT position, start, end, headword, incoming_author FROM entries WHERE path = ?"
+    parameters = [os.path.abspath(path)]
+
+    if positions is not None:
+        query += " AND position BETWEEN ? AND ?"
+        parameters.extend(positions)
+
+    return [EntryOffsets(*row) for row in connection.execute(query + " ORDER BY position", parameters)]
+
+def count_entries(connection: sqlite3.Connection, path: str) -> int:
+    return connection.execute("SELECT COUNT(*) FROM entries WHERE path = ?", (os.path.abspath(path),)).fetchone()[0]
+
+def find_entries(connection: sqlite3.Connection, paths: list[str], first: str, last: str=None) -> dict[str, list[EntryOffsets]]:
+    """Returns, by file, the entries with the headword 'first', or, if 'last' is given, every entry from the first with
+    the headword 'first' to the last with the headword 'last', in the order of 'paths'. The files must be indexed.
+
+    Raises ValueError if a headword is not found.
+    """
+    file_order = {os.path.abspath(path): number for number, path in enumerate(paths)}
+
+    def find(headword: str) -> list[tuple[int, int]]:
+        rows = connection.execute("SELECT path, position FROM entries WHERE headword = ?", (headword,))
+        found = sorted((file_order[path], position) for path, position in rows if path in file_order)
+
+        if not found:
+            raise ValueError(f"no entry has the headword '{headword}'")
+
+        return found
+
+    entries = {}
+
+    if last is None:
+        for number, position in find(first):
+            path = paths[number]
+            entries.setdefault(path, []).extend(load_entry_offsets(connection, path, (position, position)))
+
+        return entries
+
+    start = find(first)[0]
+    end = find(last)[-1]
+
+    if end < start:
+        raise ValueError(f"'{last}' comes before '{first}'")
+
+    for number in range(start[0], end[0] + 1):
+        first_position = start[1] if number == start[0] else 0
+        last_position = end[1] if number == end[0] else count_entries(connection, paths[number]) - 1
+        entries[paths[number]] = load_entry_offsets(connection, paths[number], (first_position, last_position))
+
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the byte offsets of the entries of the greatscott files.")
+    parser.add_argument("source", nargs="?", type=folder, default=default_source)
+    parser.add_argument("destination", nargs="?", type=folder, default=default_destination, help=f"the folder of the index, {index_name}, and of any output files, which are indexed too")
+    arguments = parser.parse_args()
+
+    with closing(open_entry_index(arguments.destination)) as connection:
+        for file in load_xml_files(arguments.source):
+            for path in (os.path.join(arguments.source, file), os.path.join(arguments.destination, file)):
+                if os.path.exists(path) and update_entry_index(connection, path):
+                    print(f"{path}: {count_entries(connection, path)} entries indexed")
+
+if __name__ == "__main__":
+    main()
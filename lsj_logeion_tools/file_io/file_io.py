@@ -0,0 +1,110 @@
+import gzip, lzma, mmap, os, re
+from contextlib import contextmanager
+from typing import BinaryIO
+from lxml import etree
+
+# Compressed files are read and written transparently, according to their suffix
+compression_suffixes = (".gz", ".xz")
+
+# The folder of the tools. The default source and destination folders are found from it, so that they are the same
+# wherever the tools are run from.
+tools_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repository_parent = os.path.dirname(os.path.dirname(tools_path))
+default_source = os.path.join(repository_parent, "LSJLogeion", "")
+default_destination = os.path.join(repository_parent, "LSJLogeionNew", "")
+
+def load_xml_files(path):
+    """Return the names of the greatscott files in the folder 'path', compressed or not, in order."""
+    xml_files = os.listdir(path)
+
+    re_file_match = r"greatscott\d{2}\.xml(\.gz|\.xz)?$"
+    xml_files = [x for x in xml_files if re.match(re_file_match, x)]
+
+    xml_files.sort()
+
+    return xml_files
+
+def folder(path: str) -> str:
+    """Return a folder's path with a trailing separator, as the file names are added to it."""
+    return os.path.join(path, "")
+
+def open_source(path: str) -> BinaryIO:
+    """Open a file for reading in binary mode, decompressing it if it is a .gz or .xz file."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+
+    return open(path, "rb")
+
+def read_xml(path: str) -> etree.Element:
+    """Parse an XML file and return its root, without decoding it to a string first.
+
+    Uncompressed files are memory-mapped, so lxml parses the file's bytes without a copy being made; compressed files are
+    parsed as they are decompressed.
+    """
+    if path.endswith(compression_suffixes):
+        with open_source(path) as f:
+            return etree.parse(f).getroot()
+
+    with open(path, "rb") as f:
+        # an empty file cannot be mapped, and is not XML anyway
+        if os.fstat(f.fileno()).st_size == 0:
+            return etree.fromstring(b"")
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return etree.fromstring(mapped_file)
+
+@contextmanager
+def map_source(path: str):
+    """Yield the bytes of a file: memory-mapped if it is uncompressed, or decompressed into memory if not."""
+    if path.endswith(compression_suffixes):
+        with open_source(path) as f:
+            yield f.read()
+        return
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            yield mapped_file
+
+@contextmanager
+def open_destination(path: str):
+    """Open a file for writing in binary mode, compressing it if it is a .gz or .xz file.
+
+    The file is written to a temporary file beside it, which replaces 'path' in a single step once the 'with' block has
+    finished, so that a crash never leaves a half-written file at 'path'.
+    """
+    temporary_path = path + ".tmp"
+
+    try:
+        with open(temporary_path, "wb") as raw_file:
+            if path.endswith(".gz"):
+                # the modification time is left out of the header, so that the same XML always gives the same file
+                with gzip.GzipFile(filename="", mode="wb", fileobj=raw_file, mtime=0) as f:
+                    yield f
+            elif path.endswith(".xz"):
+                with lzma.open(raw_file, "wb") as f:
+                    yield f
+            else:
+                yield raw_file
+
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    os.replace(temporary_path, path)
+
+def write_xml(path: str, root: etree.Element) -> None:
+    """Serialise 'root' as UTF-8 straight to the file 'path', through open_destination.
+
+    As with etree.tostring(root), there is no XML declaration, and anything outside the root is left out.
+    """
+    with open_destination(path) as f:
+        with etree.xmlfile(f, encoding="utf-8") as xf:
+            xf.write(root)
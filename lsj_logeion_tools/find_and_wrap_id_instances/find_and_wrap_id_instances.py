@@ -1,49 +1,63 @@
 import re
 from lxml import etree
+from utilities.utilities import regex_calls
 
-def find_and_wrap_id_instances(input_xml: str) -> str:
-    root = etree.fromstring(input_xml)
+def find_and_wrap_id_instances(root: etree.ElementBase) -> list[etree.ElementBase]:
+    """Wrap each "Id." in the tails of the elements in 'root' in a new <author> element, changing 'root' in place.
 
-    elements_for_wrapping = get_elements_for_wrapping(root)
-    
-    for element in elements_for_wrapping:
-        wrap(element)
+    Returns the new <author> elements."""
+    new_elements = []
 
-    print(f"{len(elements_for_wrapping)} new elements added")
-    return etree.tostring(root, encoding="unicode")
+    for element in get_elements_for_wrapping(root):
+        new_elements.extend(wrap(element))
+
+    return new_elements
 
 def get_elements_for_wrapping(root: etree.ElementBase) -> list[etree.ElementBase]:
+    """Returns the elements in each <div1> of 'root' with "Id." in their tail. If there is no <div1>, e.g. if 'root' is
+    a single entry, the elements in 'root' are searched instead."""
     # elements with "Id." in the *tail* are required
     elements_for_wrapping = []
 
-    entry_wrapper = root.find(".//div1")
+    entry_wrappers = list(root.iter("div1")) or [root]
+
+    for entry_wrapper in entry_wrappers:
 
-    for element in entry_wrapper.iterfind(".//*"):
+        for element in entry_wrapper.iterfind(".//*"):
 
-        if not element.tail:
-            continue
+            if not element.tail:
+                continue
 
-        re_id = r"Id\."
-        matches = re.findall(re_id, element.tail)
+            re_id = r"Id\."
+            regex_calls["get_elements_for_wrapping"] += 1
+            matches = re.findall(re_id, element.tail)
 
-        if matches:
-            elements_for_wrapping.append(element)
+            if matches:
+                elements_for_wrapping.append(element)
 
     return elements_for_wrapping
 
-def wrap(element):
+def wrap(element: etree.ElementBase) -> list[etree.ElementBase]:
+    """Wrap each "Id." in the tail of 'element' in a new <author> element.
 
+    Returns the new <author> elements."""
     parent = element.getparent()
     index = parent.index(element) + 1
 
     re_id = r"(Id\.)"
+    regex_calls["wrap"] += 1
     string_pieces = re.split(re_id, element.tail)
 
     tails = string_pieces[::2]
     element.tail = tails.pop(0)
 
+    new_elements = []
+
     for i, tail in enumerate(tails):
         new_element = etree.Element("author")
         new_element.text = "Id."
         new_element.tail = tail
         parent.insert(index + i, new_element)
+        new_elements.append(new_element)
+
+    return new_elements
@@ -1,83 +1,91 @@
-import os, sys
-from lxml import etree
-from add_moralia_references.add_moralia_references import *
-from amend_moralia_references.amend_moralia_references import *
-from find_and_wrap_id_instances.find_and_wrap_id_instances import *
-
-def main():
-
-    arguments = sys.argv[1:]
-    mode = arguments[0]
-    path_from = arguments[1] if len(arguments) > 1 else "../../LSJLogeion/"
-    path_to = arguments[2] if len(arguments) > 2 else "../../LSJLogeionNew/"
-
-    files = load_xml_files(path_from)
-    
-    error_checking = False
-
-    new_elements = []
-    new_elements_counter = 0
-
-    for file in files:
-
-        # Reset the collector for each file
-        new_elements[:] = []
-
-        with open(path_from + file, "r") as f1:
-
-            print(f"{file} in progress...")
-            
-            file_string = f1.read().encode("utf-8") # encoding required for lxml
-            root = etree.fromstring(file_string)
-            
-            if error_checking:
-                starting_text = "".join(root.itertext())
-            
-            if mode == "add":
-                plutarch_elements = get_plutarch_elements(root)
-        
-                # Wrap the references in <bibl> elements
-                for element in plutarch_elements:
-                    new_elements[:] = []
-                    new_elements = wrap_references(element)
-                    # TODO: does wrap_reference return False if it fails? it needs to for the following conditional...
-                    if new_elements:
-                        new_elements_counter += len(new_elements)
-
-            elif mode == "amend":
-                moralia_bibls = get_moralia_bibls(root)
-                new_elements = process_moralia_bibls(moralia_bibls)
-                new_elements_counter += len(new_elements)
-
-            elif mode == "id":
-                file_string = find_and_wrap_id_instances(file_string)
-
-            # Error checking - has the text changed?
-            if error_checking:
-                ending_text = "".join(root.itertext())
-                if starting_text != ending_text:
-                    print("WARNING: text has been changed during the process!")
-                    return
-
-            # Save the new XML
-            with open(path_to + file, "w") as f2:
-                file_string = etree.tostring(root, encoding="unicode")
-                f2.write(file_string)
-                print(f"{file} done!")
-
-            # output the file's added references
-            print(f"{new_elements_counter} elements added/changed")
-
-def load_xml_files(path):
-    
-    xml_files = os.listdir(path)
-
-    re_file_match = "greatscott\d{2}\.xml"
-    xml_files = [x for x in xml_files if re.match(re_file_match, x)]
-    
-    xml_files.sort()
-
-    return xml_files
+import argparse, os, sys
+from importlib import import_module
+from file_io.file_io import default_destination, default_source, folder
+from pipeline.pipeline import parse_stages
+
+# The commands other than the modes, by name: the module whose main() runs each, and what it does. Only the modules
+# of the command or mode which is run are imported.
+commands = {
+    "index": ("entry_index.entry_index", "index the byte offsets of the entries of the greatscott files"),
+    "citations": ("citation_index.citation_index", "index and query the Moralia citations of the amended files"),
+    "worker": ("worker.worker", "keep a pipeline loaded for entries sent as lines of JSON"),
+    "corpus": ("benchmarks.corpus_generator", "write a synthetic corpus of greatscott files"),
+    "benchmark": ("benchmarks.benchmarks", "time each mode on a synthetic corpus"),
+}
+
+def main(arguments: list[str]=None, prog: str=None):
+    """Run a mode, e.g. "python main.py add,amend", or one of the other commands, e.g. "python main.py index"."""
+    arguments = sys.argv[1:] if arguments is None else arguments
+    prog = os.path.basename(sys.argv[0]) if prog is None else prog
+
+    if arguments and arguments[0] in commands:
+        run_command(arguments[0], arguments[1:], prog)
+        return
+
+    arguments = parse_arguments(arguments, prog)
+
+    # the modules which run the stages are only imported once the arguments have been parsed
+    from processing.processing import run_mode
+
+    run_mode(arguments)
+
+def run_command(name: str, arguments: list[str], prog: str) -> None:
+    """Import the module of a command and run its main() with 'arguments' as its command line."""
+    module = import_module(commands[name][0])
+    sys.argv = [f"{prog} {name}", *arguments]
+    module.main()
+
+def get_commands_help(prog: str=None) -> str:
+    prog = os.path.basename(sys.argv[0]) if prog is None else prog
+    lines = [f"other commands (see {prog} COMMAND --help):"]
+
+    for name, (_, description) in commands.items():
+        lines.append(f"  {name:<11}{description}")
+
+    return "\n".join(lines)
+
+def parse_arguments(arguments: list[str], prog: str=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description="Amend the LSJLogeion XML files.", epilog=get_commands_help(prog), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("stages", metavar="mode", type=parse_stages, help="id, add, amend, all, or a comma-separated list of stages, e.g. id,add")
+    parser.add_argument("source", nargs="?", type=folder, default=default_source, help="the folder of the greatscott files (by default LSJLogeion, next to this repository)")
+    parser.add_argument("destination", nargs="?", type=folder, default=default_destination, help="the folder of the amended files (by default LSJLogeionNew, next to this repository)")
+    parser.add_argument("--workers", type=int, default=1, help="number of files to process in parallel")
+    parser.add_argument("--stream", action="store_true", help="process each file one <div2> entry at a time")
+    parser.add_argument("--prefetch", type=int, default=0, help="number of files read ahead, and waiting to be written, while a file is transformed; 0 (the default) processes one file at a time")
+    parser.add_argument("--force", action="store_true", help="process every file, even those which are up to date")
+    parser.add_argument("--profile", metavar="FILE", help="save the time taken by each file and stage, the peak memory and counters to FILE as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="write nothing, but print a JSON line for each change which would be made")
+    parser.add_argument("--no-index", dest="index", action="store_false", help="do not use the index of the entries which need amending")
+    parser.add_argument("--no-verify", dest="verify", action="store_false", help="do not check that the text of each entry is unchanged")
+    parser.add_argument("--prefilter", action="store_true", help="find the entries which the stages could change by a search of the raw bytes, and copy the rest byte for byte")
+    parser.add_argument("--headword", help="process only the entries with this headword, splicing them into the existing output files")
+    parser.add_argument("--to-headword", metavar="HEADWORD", help="with --headword, process every entry from the first with --headword to the last with this headword")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="also print each new element")
+    parser.add_argument("-q", "--quiet", action="store_true", help="print warnings only")
+
+    # intermixed, so that the options can come before the folders as well as after them
+    arguments = parser.parse_intermixed_args(arguments)
+    arguments.verbosity = 0 if arguments.quiet else 1 + arguments.verbose
+
+    if arguments.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if arguments.prefetch < 0:
+        parser.error("--prefetch must be at least 0")
+
+    if arguments.stream and arguments.dry_run:
+        parser.error("--dry-run cannot be combined with --stream")
+
+    if arguments.prefilter and arguments.stream:
+        parser.error("--prefilter cannot be combined with --stream")
+
+    if arguments.to_headword and not arguments.headword:
+        parser.error("--to-headword requires --headword")
+
+    if arguments.headword and (arguments.stream or arguments.workers > 1):
+        parser.error("--headword cannot be combined with --stream or --workers")
+
+    return arguments
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
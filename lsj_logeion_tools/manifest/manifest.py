@@ -0,0 +1,44 @@
+import hashlib, json, os
+
+# The manifest records, for each file in the destination folder, what it was made from
+manifest_name = ".lsj_manifest.json"
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    file_hash = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+def load_manifest(path_to: str) -> dict:
+    """Return the manifest of the destination folder 'path_to', or an empty manifest if there is none."""
+    manifest_path = os.path.join(path_to, manifest_name)
+
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(path_to: str, manifest: dict) -> None:
+    """Save the manifest in the destination folder 'path_to', replacing the old manifest in a single step."""
+    manifest_path = os.path.join(path_to, manifest_name)
+    temporary_path = manifest_path + ".tmp"
+
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    os.replace(temporary_path, manifest_path)
+
+def make_manifest_entry(source_hash: str, resources_hash: str, stages: list[str]) -> dict:
+    return {"source_hash": source_hash, "resources_hash": resources_hash, "stages": list(stages)}
+
+def is_current(manifest: dict, file: str, entry: dict, path_to: str) -> bool:
+    """Return True if the output for 'file' exists and was made from the same source, resources and stages as 'entry'."""
+    if not os.path.exists(os.path.join(path_to, file)):
+        return False
+
+    return manifest["files"].get(file) == entry
@@ -0,0 +1,160 @@
+import argparse
+from collections import Counter
+from importlib import import_module
+from typing import NamedTuple
+from lxml import etree
+from profiler.profiler import FileProfile, profile_stage
+from utilities.utilities import get_moralia_table, make_change_record
+from verification.verification import get_changed_headwords, hash_entries
+
+# The module of each stage, in the order in which "all" runs them. Each is imported when its stage is first run, so that
+# e.g. the id stage alone does not import the others.
+stage_modules = {
+    "id": "find_and_wrap_id_instances.find_and_wrap_id_instances",
+    "add": "add_moralia_references.add_moralia_references",
+    "amend": "amend_moralia_references.amend_moralia_references",
+}
+
+stage_names = list(stage_modules)
+
+# The stages which use the Moralia table
+table_stage_names = ["add", "amend"]
+
+def parse_stages(mode: str) -> list[str]:
+    """Return the stages to run, in order, for a mode: a single stage, "all", or a comma-separated list of stages."""
+    if mode == "all":
+        return list(stage_names)
+
+    stages = mode.split(",")
+
+    for stage in stages:
+        if stage not in stage_names:
+            raise argparse.ArgumentTypeError(f"invalid stage '{stage}' (choose from {', '.join(stage_names)} or all)")
+
+    return stages
+
+def transform(root: etree.Element, stages: list[str], last_author: dict=None, profile: FileProfile=None, change_log: list[dict]=None) -> int:
+    """Apply each of the stages in turn to 'root', which may be a whole file or a single entry.
+
+    change_log optionally collects a record of each <bibl> element added or amended.
+
+    Returns the number of elements added or changed.
+    """
+    new_elements_counter = 0
+
+    # the context of each element, shared by the stages which follow the id stage (see annotate)
+    annotations = None
+
+    for stage in stages:
+
+        if profile:
+            profile.count("elements_scanned", sum(1 for _ in root.iter()))
+
+        if stage == "id":
+            from find_and_wrap_id_instances.find_and_wrap_id_instances import find_and_wrap_id_instances
+
+            with profile_stage(profile, "transform"):
+                new_elements = find_and_wrap_id_instances(root)
+                new_elements_counter += len(new_elements)
+
+            # any annotations made by an earlier stage do not have the new <author> elements
+            annotations = None
+
+            if profile:
+                profile.count("id_authors_added", len(new_elements))
+
+        elif stage == "add":
+            from add_moralia_references.add_moralia_references import annotate, get_reference_elements, wrap_references
+
+            with profile_stage(profile, "scan"):
+                annotations = annotate(root, last_author)
+                reference_elements = get_reference_elements(root, annotations=annotations)
+
+            # Wrap the references in <bibl> elements
+            with profile_stage(profile, "transform"):
+                for element, resolver in reference_elements:
+                    new_elements = wrap_references(element, resolver=resolver)
+                    # TODO: does wrap_reference return False if it fails? it needs to for the following conditional...
+                    if new_elements:
+                        annotations.insert(new_elements)
+                        new_elements_counter += len(new_elements)
+
+                        if change_log is not None:
+                            change_log.extend(make_change_record("add", e, title=e.find("title").text) for e in new_elements)
+
+                        if profile:
+                            profile.count("references_wrapped", len(new_elements))
+
+        elif stage == "amend":
+            from amend_moralia_references.amend_moralia_references import get_moralia_bibls, process_moralia_bibls
+
+            amendments_counter = Counter()
+
+            with profile_stage(profile, "scan"):
+                moralia_bibls = get_moralia_bibls(root, annotations)
+
+            with profile_stage(profile, "transform"):
+                new_elements = process_moralia_bibls(moralia_bibls, amendments_counter, change_log, annotations)
+                new_elements_counter += len(new_elements)
+
+            if profile:
+                profile.count("bibls_amended", len(new_elements))
+
+                for kind, amendments in amendments_counter.items():
+                    profile.count(f"amendments:{kind}", amendments)
+
+    return new_elements_counter
+
+class PipelineResult(NamedTuple):
+    new_elements: int
+    # a record of each <bibl> element added or amended
+    changes: list[dict]
+    # the headwords of the entries whose text, outside of titles, was changed
+    changed_headwords: list[str]
+    # the author in force at the end of the tree, to be passed on to the entry which follows it
+    last_author: str | None
+
+class Pipeline:
+    """The stages of main.py, for use by other programs on a file, a tree or a single entry.
+
+    The modules and tables the stages use are loaded when the pipeline is made, so that each call only does the work
+    of its input.
+    """
+
+    def __init__(self, stages: list[str]=None, verify: bool=True):
+        self.stages = list(stage_names) if stages is None else list(stages)
+        self.verify = verify
+
+        for stage in self.stages:
+            if stage not in stage_names:
+                raise ValueError(f"invalid stage '{stage}' (choose from {', '.join(stage_names)})")
+
+            import_module(stage_modules[stage])
+
+        if any(stage in table_stage_names for stage in self.stages):
+            get_moralia_table()
+
+    def process_tree(self, root: etree.Element, last_author: str=None) -> PipelineResult:
+        """Apply the stages to 'root', in place. 'last_author' is the author in force before it, if it is not the
+        start of a file."""
+        hashed_entries = hash_entries(root) if self.verify else []
+        changes = []
+        author = {"author": last_author}
+
+        new_elements = transform(root, self.stages, author, change_log=changes)
+
+        return PipelineResult(new_elements, changes, get_changed_headwords(hashed_entries), author["author"])
+
+    def process_entry(self, entry: etree.Element, last_author: str=None) -> PipelineResult:
+        """Apply the stages to a single <div2> entry, in place."""
+        if entry.tag != "div2":
+            raise ValueError(f"expected a <div2> entry, not <{entry.tag}>")
+
+        return self.process_tree(entry, last_author)
+
+    def process_bytes(self, data: bytes, last_author: str=None) -> tuple[bytes, PipelineResult]:
+        """Apply the stages to the XML in 'data', which may be a whole file or a single entry. Returns the new XML."""
+        root = etree.fromstring(data)
+        result = self.process_tree(root, last_author)
+
+        return etree.tostring(root, encoding="utf-8"), result
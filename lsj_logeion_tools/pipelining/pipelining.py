@@ -0,0 +1,124 @@
+import queue, threading
+from typing import Callable, Iterable, Iterator
+
+# Put on a queue after the last item
+finished = object()
+
+def run_pipelined(items: Iterable, read: Callable, process: Callable, write: Callable, prefetch: int=1) -> Iterator[tuple]:
+    """Read, process and write each item, overlapping the reading of the next items and the writing of the previous one
+    with the processing of the current one.
+
+    read(item) runs in a reader thread, process(item, data) in the calling thread, and write(item, data) in a writer
+    thread. At most 'prefetch' items wait to be processed, and at most 'prefetch' to be written, which bounds the memory
+    used. An exception in any of them is raised here, once the items before it have been written.
+
+    Yields (item, the result of process) once each item has been written, in order.
+    """
+    read_queue = queue.Queue(maxsize=prefetch)
+    write_queue = queue.Queue(maxsize=prefetch)
+    written_queue = queue.Queue()
+    stop = threading.Event()
+
+    def put(q: queue.Queue, value) -> bool:
+        # gives up if the pipeline is stopped while the queue is full
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def reader():
+        try:
+            for item in items:
+                if not put(read_queue, (item, read(item), None)):
+                    return
+
+        except BaseException as error:
+            put(read_queue, (None, None, error))
+            return
+
+        put(read_queue, finished)
+
+    def writer():
+        error = None
+
+        while True:
+            value = write_queue.get()
+
+            if value is finished:
+                written_queue.put(finished)
+                return
+
+            item, data, result = value
+
+            # after an error, the rest are taken off the queue but not written, so that process is never blocked
+            if error is None:
+                try:
+                    write(item, data)
+                except BaseException as e:
+                    error = e
+
+            written_queue.put((item, result, error))
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+
+    for thread in threads:
+        thread.start()
+
+    def written(block: bool) -> Iterator[tuple]:
+        while True:
+            try:
+                value = written_queue.get(block=block)
+            except queue.Empty:
+                return
+
+            if value is finished:
+                return
+
+            item, result, error = value
+
+            if error is not None:
+                raise error
+
+            yield item, result
+
+    try:
+        error = None
+
+        while True:
+            value = read_queue.get()
+
+            if value is finished:
+                break
+
+            item, data, error = value
+
+            if error is not None:
+                break
+
+            try:
+                result = process(item, data)
+            except Exception as e:
+                error = e
+                break
+
+            write_queue.put((item, data, result))
+
+            yield from written(block=False)
+
+        # the items already processed are written before an error in reading or processing is raised
+        write_queue.put(finished)
+        yield from written(block=True)
+
+        if error is not None:
+            raise error
+
+    finally:
+        stop.set()
+        write_queue.put(finished)
+
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,127 @@
+import html, re
+from bisect import bisect_right
+from typing import NamedTuple
+from entry_index.entry_index import scan_entry_spans
+from resolvers.resolvers import resolvers
+
+# The start of the root element: the first tag which is not a declaration, processing instruction or comment
+re_root_start = re.compile(rb"<(?![?!])")
+
+# If more than this share of the entries of a file are marked, transforming them one by one costs more than transforming
+# the file as a whole
+max_marked_share = 0.5
+
+class PrefilteredEntry(NamedTuple):
+    start: int
+    end: int
+    # whether the entry has any of the markers of the stages, and so must be transformed
+    marked: bool
+
+def get_markers(stages: list[str]) -> list[bytes]:
+    """Returns the bytes, at least one of which is in any entry which the stages could change, whatever author is in
+    force at its start.
+
+    A character reference could spell out any of them, so "&#" is a marker too.
+    """
+    markers = [b"&#"]
+
+    if "id" in stages:
+        markers.append(b"Id.")
+
+    if "add" in stages:
+        # an <author> element for an author with a resolver; the references which follow it are found by the resolver
+        markers.extend(html.escape(author, quote=False).encode("utf-8") for author in resolvers)
+
+    if "amend" in stages:
+        markers.extend([b"tlg,0007", b"tlg,0094"])
+
+    return markers
+
+def find_marker_positions(data: bytes, markers: list[bytes], start: int=0, end: int=None) -> list[int]:
+    """Returns the position of every occurrence of each marker in data[start:end], in order."""
+    end = len(data) if end is None else end
+    positions = []
+
+    for marker in markers:
+        position = data.find(marker, start, end)
+
+        while position != -1:
+            positions.append(position)
+            position = data.find(marker, position + 1, end)
+
+    positions.sort()
+
+    return positions
+
+def prefilter_entries(data: bytes, stages: list[str]) -> tuple[int, int, list[PrefilteredEntry]] | None:
+    """Finds the entries in the bytes of a file, and which of them have any of the markers of the stages, without
+    parsing it.
+
+    Returns the start and end of the root element and the entries. Returns None if the stages could change anything
+    outside the entries, or the bytes cannot be relied on: if there is a marker, an <author> or anything like a reference
+    outside the entries, a DOCTYPE which declares entities, or a carriage return.
+    """
+    # the parser turns carriage returns into line feeds in the entries it transforms, but the copied bytes would keep them
+    if b"\r" in data:
+        return None
+
+    root_start = re_root_start.search(data)
+
+    if root_start is None or b"<!ENTITY" in data[:root_start.start()]:
+        return None
+
+    root_start = root_start.start()
+    root_end = data.rfind(b">") + 1
+
+    try:
+        spans = [(start, end) for start, end, _ in scan_entry_spans(data, root_start, root_end, authors=False)]
+    except ValueError:
+        return None
+
+    if not spans:
+        return None
+
+    markers = get_markers(stages)
+    outside_start = root_start
+
+    for start, end in spans + [(root_end, root_end)]:
+        if has_outside_changes(data, outside_start, start, markers):
+            return None
+
+        outside_start = end
+
+    marker_positions = find_marker_positions(data, markers, root_start, root_end)
+    entries = []
+
+    for start, end in spans:
+        # a marker which begins within the entry; markers cannot span entries, as the tags between them are not markers
+        index = bisect_right(marker_positions, start - 1)
+        marked = index < len(marker_positions) and marker_positions[index] < end
+        entries.append(PrefilteredEntry(start, end, marked))
+
+    return root_start, root_end, entries
+
+def has_outside_changes(data: bytes, start: int, end: int, markers: list[bytes]) -> bool:
+    """Returns True if the stages could change anything in data[start:end], which is outside the entries."""
+    region = data[start:end]
+
+    # usually only the whitespace between entries
+    if not region.strip():
+        return False
+
+    if b"<author" in region or any(marker in region for marker in markers):
+        return True
+
+    text = region.decode("utf-8", errors="replace")
+
+    return any(resolver.pattern.search(text) for resolver in resolvers.values())
+
+def could_change_unmarked(entry: bytes) -> bool:
+    """Returns True if an entry without markers could still be changed, or could change the author in force, when it
+    follows an <author> with a resolver."""
+    if b"<author" in entry:
+        return True
+
+    text = entry.decode("utf-8", errors="replace")
+
+    return any(resolver.pattern.search(text) for resolver in resolvers.values())
@@ -0,0 +1,534 @@
+import argparse, contextlib, io, json, os, sys, time
+from collections import Counter
+from contextlib import closing
+from itertools import repeat
+from typing import Iterator
+from lxml import etree
+from candidate_index.candidate_index import *
+from entry_index.entry_index import count_entries, find_entries, load_entry_offsets, open_entry_index, splice_entries, update_entry_index
+from file_io.file_io import load_xml_files, map_source, open_destination, open_source, read_xml, write_xml
+from manifest.manifest import *
+from pipeline.pipeline import Pipeline, transform
+from pipelining.pipelining import run_pipelined
+from prefilter.prefilter import could_change_unmarked, max_marked_share, prefilter_entries
+from profiler.profiler import FileProfile, make_report, profile_stage, save_report
+from resolvers.resolvers import resolvers
+from streaming.streaming import stream_entries
+from utilities.utilities import get_call_counts, get_moralia_abbreviations_path, log, set_verbosity
+from verification.verification import get_changed_headwords, hash_entries
+
+def run_mode(arguments: argparse.Namespace) -> None:
+    """Run the stages of a mode on the files of the source folder, with the options parsed by main.parse_arguments."""
+    stages = arguments.stages
+    path_from = arguments.source
+    path_to = arguments.destination
+
+    set_verbosity(arguments.verbosity)
+    start = time.perf_counter()
+
+    # In a dry run the change log is written to stdout, so the console output goes to stderr instead
+    change_log_file = sys.stdout
+    console = contextlib.redirect_stdout(sys.stderr) if arguments.dry_run else contextlib.nullcontext()
+
+    with console:
+        files = load_xml_files(path_from)
+
+        if arguments.headword:
+            # Only the chosen entries are processed, and spliced into the existing output; the manifest is left alone
+            new_elements_counter = 0
+
+            for file, file_counter, change_log in process_headwords(files, stages, path_from, path_to, arguments.headword, arguments.to_headword, arguments.dry_run, arguments.verify):
+                new_elements_counter += file_counter
+
+                if arguments.dry_run:
+                    write_change_log(change_log_file, file, change_log)
+
+                log(f"{new_elements_counter} elements added/changed")
+
+            return
+
+        # Skip the files whose output was made from the same source, resources and stages by an earlier run. A dry run
+        # writes no output, so it reports on every file and leaves the manifest alone.
+        manifest = load_manifest(path_to)
+        resources_hash = hash_file(get_moralia_abbreviations_path())
+        manifest_entries = {file: make_manifest_entry(hash_file(path_from + file), resources_hash, stages) for file in files}
+
+        if not arguments.force and not arguments.dry_run:
+            current_files = [file for file in files if is_current(manifest, file, manifest_entries[file], path_to)]
+
+            for file in current_files:
+                log(f"{file} is up to date")
+
+            files = [file for file in files if file not in current_files]
+
+        def record_file(file, change_log):
+            if arguments.dry_run:
+                write_change_log(change_log_file, file, change_log)
+                return
+
+            manifest["files"][file] = manifest_entries[file]
+            save_manifest(path_to, manifest)
+
+        # The candidate index is kept in the destination folder, which a dry run leaves alone
+        use_index = arguments.index and not arguments.dry_run
+        source_hashes = {file: manifest_entries[file]["source_hash"] if use_index else None for file in files}
+
+        new_elements_counter = 0
+        file_profiles = []
+
+        if arguments.workers > 1:
+            # imported only for --workers, as it is slow to import
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Each worker parses, transforms and writes its own file; the logs are replayed here in file order
+            with ProcessPoolExecutor(max_workers=arguments.workers, initializer=set_verbosity, initargs=(arguments.verbosity,)) as executor:
+                results = executor.map(process_file_captured, files, repeat(stages), repeat(path_from), repeat(path_to), repeat(arguments.stream), repeat(bool(arguments.profile)), repeat(arguments.dry_run), repeat(arguments.verify), [source_hashes[file] for file in files], repeat(arguments.prefilter))
+
+                for file, (file_counter, output, file_profile, change_log) in zip(files, results):
+                    print(output, end="")
+                    record_file(file, change_log)
+                    new_elements_counter += file_counter
+                    log(f"{new_elements_counter} elements added/changed")
+
+                    if file_profile:
+                        file_profiles.append(file_profile)
+
+        else:
+            if arguments.prefetch and not arguments.stream and not arguments.prefilter:
+                # The next files are read and the last one written while each file is transformed
+                results = process_files_pipelined(files, stages, path_from, path_to, bool(arguments.profile), arguments.dry_run, arguments.verify, source_hashes, arguments.prefetch)
+            else:
+                results = process_files_serially(files, stages, path_from, path_to, arguments.stream, bool(arguments.profile), arguments.dry_run, arguments.verify, source_hashes, arguments.prefilter)
+
+            for file, file_counter, profile, change_log in results:
+                new_elements_counter += file_counter
+                record_file(file, change_log)
+                log(f"{new_elements_counter} elements added/changed")
+
+                if profile:
+                    file_profiles.append(profile.to_dict())
+
+    if arguments.profile:
+        save_report(arguments.profile, make_report(file_profiles, time.perf_counter() - start))
+
+def process_file(file: str, stages: list[str], path_from: str, path_to: str, stream: bool=False, profile: FileProfile=None, change_log: list[dict]=None, verify: bool=True, source_hash: str=None, prefilter: bool=False) -> int:
+    """Parse, transform and save a single XML file. The stages all run on the same tree, which is parsed and saved once.
+
+    If 'stream' is True, the file is parsed, transformed and written one <div2> entry at a time. If a profile is given,
+    the time taken by each stage and the counters of the file are recorded in it. If a change log is given, the file is
+    a dry run: a record of each change is added to the change log, and nothing is written. If 'verify' is True, a
+    warning is printed for each entry whose text is changed. If the hash of the source file is given, the add and amend
+    stages only transform the entries found by its candidate index. If 'prefilter' is True, only the entries found by a
+    search of the file's bytes are parsed and transformed, if the file allows it.
+
+    Returns the number of elements added or changed in the file.
+    """
+    call_counts_before = get_call_counts() if profile else None
+
+    if stream:
+        new_elements_counter = stream_file(file, stages, path_from, path_to, profile, verify, source_hash)
+    else:
+        new_elements_counter = prefilter_file(file, stages, path_from, path_to, profile, change_log, verify) if prefilter else None
+
+        if new_elements_counter is None:
+            new_elements_counter = transform_file(file, stages, path_from, path_to, profile, change_log, verify, source_hash)
+
+    count_calls(profile, call_counts_before)
+
+    return new_elements_counter
+
+def process_files_serially(files: list[str], stages: list[str], path_from: str, path_to: str, stream: bool, profiling: bool, dry_run: bool, verify: bool, source_hashes: dict, prefilter: bool=False) -> Iterator[tuple[str, int, FileProfile | None, list[dict] | None]]:
+    """Process each file in turn with process_file.
+
+    Yields the file, the number of elements added or changed, its profile if profiling, and its change log if it is a
+    dry run, once each file is done.
+    """
+    for file in files:
+        profile = FileProfile(file) if profiling else None
+        change_log = [] if dry_run else None
+        new_elements_counter = process_file(file, stages, path_from, path_to, stream, profile, change_log, verify, source_hashes[file], prefilter)
+
+        yield file, new_elements_counter, profile, change_log
+
+def process_files_pipelined(files: list[str], stages: list[str], path_from: str, path_to: str, profiling: bool, dry_run: bool, verify: bool, source_hashes: dict, prefetch: int=1) -> Iterator[tuple[str, int, FileProfile | None, list[dict] | None]]:
+    """Process the files as process_files_serially does, but parse the next files in a reader thread, and serialise and
+    write the previous ones in a writer thread, while each file is transformed. lxml releases the GIL while it parses and
+    serialises, so the reading and writing overlap with the transform.
+
+    At most 'prefetch' parsed trees wait to be transformed, and 'prefetch' to be written.
+    """
+    profiles = {}
+
+    def read(file):
+        profiles[file] = FileProfile(file) if profiling else None
+        return read_file(file, path_from, profiles[file])
+
+    def process(file, root):
+        log(f"{file} in progress...")
+
+        profile = profiles[file]
+        change_log = [] if dry_run else None
+        call_counts_before = get_call_counts() if profile else None
+
+        new_elements_counter = transform_tree(file, root, stages, path_to, profile, change_log, verify, source_hashes[file])
+        count_calls(profile, call_counts_before)
+
+        return new_elements_counter, change_log
+
+    def write(file, root):
+        # a dry run writes nothing
+        if not dry_run:
+            write_file(file, root, path_to, profiles[file])
+
+    for file, (new_elements_counter, change_log) in run_pipelined(files, read, process, write, prefetch):
+        log(f"{file} done!")
+
+        yield file, new_elements_counter, profiles.pop(file), change_log
+
+def count_calls(profile: FileProfile | None, call_counts_before: Counter) -> None:
+    """Add the regular expression searches and cache lookups made since 'call_counts_before' was taken by
+    get_call_counts to the counters of the profile."""
+    if not profile:
+        return
+
+    for name, calls in (get_call_counts() - call_counts_before).items():
+        profile.count(name, calls)
+
+def transform_file(file: str, stages: list[str], path_from: str, path_to: str, profile: FileProfile=None, change_log: list[dict]=None, verify: bool=True, source_hash: str=None) -> int:
+    """Transform a single XML file as one tree.
+
+    If the hash of the source file is given, the add and amend stages are run on each candidate entry in turn, rather
+    than on the whole tree. The id stage still needs the whole tree, so it must come first.
+
+    Returns the number of elements added or changed in the file.
+    """
+    log(f"{file} in progress...")
+
+    root = read_file(file, path_from, profile)
+    new_elements_counter = transform_tree(file, root, stages, path_to, profile, change_log, verify, source_hash)
+
+    # a dry run writes nothing
+    if change_log is None:
+        write_file(file, root, path_to, profile)
+
+    log(f"{file} done!")
+
+    return new_elements_counter
+
+def prefilter_file(file: str, stages: list[str], path_from: str, path_to: str, profile: FileProfile=None, change_log: list[dict]=None, verify: bool=True) -> int | None:
+    """Transform only those entries of a file which the stages could change, found by a search of its raw bytes (see
+    prefilter_entries), and copy everything else byte for byte, without parsing it.
+
+    An entry is transformed if it has a marker, or if it follows an <author> with a resolver and could have a reference
+    or an <author> of its own. The author in force is carried from one transformed entry to the next.
+
+    Returns the number of elements added or changed in the file, or None, having done nothing, if the file must be
+    transformed as a whole.
+    """
+    with map_source(path_from + file) as data:
+        with profile_stage(profile, "scan"):
+            prefiltered = prefilter_entries(data, stages)
+
+        if prefiltered is None:
+            log(f"{file} cannot be prefiltered, so it is transformed as a whole")
+            return None
+
+        root_start, root_end, entries = prefiltered
+
+        if sum(entry.marked for entry in entries) > max_marked_share * len(entries):
+            log(f"most entries of {file} could be changed, so it is transformed as a whole")
+            return None
+
+        log(f"{file} in progress...")
+
+        last_author = {"author": None}
+        new_entries = {}
+        new_elements_counter = 0
+        entry_changes = None if change_log is None else []
+
+        for index, entry in enumerate(entries):
+            entry_bytes = data[entry.start:entry.end]
+
+            with profile_stage(profile, "scan"):
+                if not entry.marked and (last_author["author"] not in resolvers or not could_change_unmarked(entry_bytes)):
+                    continue
+
+            with profile_stage(profile, "parse"):
+                root = etree.fromstring(entry_bytes)
+
+            with profile_stage(profile, "verify"):
+                hashed_entries = hash_entries(root) if verify else []
+
+            new_elements_counter += transform(root, stages, last_author, profile, entry_changes)
+
+            with profile_stage(profile, "verify"):
+                report_changed_text(file, get_changed_headwords(hashed_entries), profile)
+
+            with profile_stage(profile, "write"):
+                new_entries[index] = etree.tostring(root, encoding="utf-8")
+
+        if change_log is not None:
+            # in the order of a whole-file run: by stage, then through the file
+            change_log.extend(sorted(entry_changes, key=lambda record: stages.index(record["stage"])))
+
+        if profile:
+            profile.count("entries_transformed", len(new_entries))
+            profile.count("entries_prefiltered", len(entries) - len(new_entries))
+
+        # a dry run writes nothing
+        if change_log is None:
+            with profile_stage(profile, "write"):
+                with open_destination(path_to + file) as f:
+                    position = root_start
+
+                    for index, new_entry in new_entries.items():
+                        f.write(data[position:entries[index].start])
+                        f.write(new_entry)
+                        position = entries[index].end
+
+                    f.write(data[position:root_end])
+
+    log(f"{file} done!")
+
+    return new_elements_counter
+
+def read_file(file: str, path_from: str, profile: FileProfile=None) -> etree.Element:
+    """Parse a single XML file, which is read as it is parsed, and return its root."""
+    with profile_stage(profile, "parse"):
+        return read_xml(path_from + file)
+
+def write_file(file: str, root: etree.Element, path_to: str, profile: FileProfile=None) -> None:
+    """Save the new XML of a file, which is written as it is serialised."""
+    with profile_stage(profile, "write"):
+        write_xml(path_to + file, root)
+
+def transform_tree(file: str, root: etree.Element, stages: list[str], path_to: str, profile: FileProfile=None, change_log: list[dict]=None, verify: bool=True, source_hash: str=None) -> int:
+    """Transform the parsed tree of a file, as transform_file does.
+
+    Returns the number of elements added or changed in the file.
+    """
+    selected_entries = None
+
+    if source_hash is not None and "id" not in stages[1:]:
+        with profile_stage(profile, "index"):
+            selected_entries = select_entries(root, get_file_candidates(path_to, source_hash, root), stages)
+
+    if verify:
+        with profile_stage(profile, "verify"):
+            # the id stage changes entries which are not candidates
+            if selected_entries is None or "id" in stages:
+                hashed_entries = hash_entries(root)
+            else:
+                hashed_entries = [hashed_entry for entry, _ in selected_entries for hashed_entry in hash_entries(entry)]
+
+    if selected_entries is None:
+        new_elements_counter = transform(root, stages, profile=profile, change_log=change_log)
+    else:
+        new_elements_counter = transform(root, ["id"], profile=profile) if "id" in stages else 0
+        entry_stages = [stage for stage in stages if stage != "id"]
+
+        for entry, incoming_author in selected_entries:
+            new_elements_counter += transform(entry, entry_stages, {"author": incoming_author}, profile, change_log)
+
+        if profile:
+            profile.count("entries_transformed", len(selected_entries))
+
+    # Error checking - has the text of any entry changed?
+    if verify:
+        with profile_stage(profile, "verify"):
+            report_changed_text(file, get_changed_headwords(hashed_entries), profile)
+
+    return new_elements_counter
+
+def stream_file(file: str, stages: list[str], path_from: str, path_to: str, profile: FileProfile=None, verify: bool=True, source_hash: str=None) -> int:
+    """Transform a single XML file entry by entry, so that memory use does not grow with the size of the file.
+
+    Reading, parsing, serialising and writing are interleaved, so they are profiled together as the "stream" stage. If
+    the hash of the source file is given and the file is in the candidate index, only the candidate entries are
+    transformed; the others are written as they are. If it is not in the index yet, each entry is indexed as it passes.
+
+    Returns the number of elements added or changed in the file.
+    """
+    # the last <author> is carried from one entry to the next, as it is when the whole file is processed at once
+    last_author = {"author": None}
+
+    log(f"{file} in progress...")
+
+    file_candidates = None
+    new_candidates = {}
+    position = -1
+    scanned_author = None
+
+    # as for a whole file, the index can only be used if the id stage comes first
+    if "id" in stages[1:]:
+        source_hash = None
+
+    if source_hash is not None:
+        with closing(open_index(path_to)) as connection:
+            file_candidates = load_candidates(connection, source_hash)
+
+    # a whole-file index which found something outside the entries was made for a different last <author>
+    if file_candidates is not None and file_candidates.outside:
+        source_hash = None
+        file_candidates = None
+
+    def process_entry(entry):
+        nonlocal position, scanned_author
+        position += 1
+        entry_stages = stages
+
+        if file_candidates is not None:
+            entry_candidates = file_candidates.candidates.get(position)
+
+            # every entry may need the id stage, but only the candidates need the others
+            if entry_candidates is None or not entry_candidates.is_candidate(stages):
+                entry_stages = [stage for stage in stages if stage == "id"]
+
+                if not entry_stages:
+                    return 0
+            else:
+                last_author["author"] = entry_candidates.incoming_author
+
+                if profile:
+                    profile.count("entries_transformed")
+
+        elif source_hash is not None:
+            with profile_stage(profile, "index"):
+                entry_candidates, scanned_author = scan_entry(entry, position, scanned_author)
+
+            if any(entry_candidates[2:]):
+                new_candidates[position] = entry_candidates
+
+        if not verify:
+            return transform(entry, entry_stages, last_author, profile)
+
+        with profile_stage(profile, "verify"):
+            hashed_entries = hash_entries(entry)
+
+        new_elements_counter = transform(entry, entry_stages, last_author, profile)
+
+        with profile_stage(profile, "verify"):
+            report_changed_text(file, get_changed_headwords(hashed_entries), profile)
+
+        return new_elements_counter
+
+    with profile_stage(profile, "stream"):
+        with open_source(path_from + file) as f1, open_destination(path_to + file) as f2:
+            new_elements_counter = stream_entries(f1, f2, process_entry)
+
+    # whether there is anything outside the entries is not known, so a whole-file run will index the file again
+    if source_hash is not None and file_candidates is None:
+        with closing(open_index(path_to)) as connection:
+            save_candidates(connection, source_hash, FileCandidates(position + 1, None, new_candidates))
+
+    # the time spent scanning, transforming, verifying and indexing the entries is part of the stream as well
+    if profile:
+        for stage in ["scan", "transform", "verify", "index"]:
+            profile.stage_times["stream"] -= profile.stage_times[stage]
+
+    log(f"{file} done!")
+
+    return new_elements_counter
+
+def process_file_captured(file: str, stages: list[str], path_from: str, path_to: str, stream: bool=False, profiling: bool=False, dry_run: bool=False, verify: bool=True, source_hash: str=None, prefilter: bool=False) -> tuple[int, str, dict | None, list[dict] | None]:
+    """Run process_file in a worker process, capturing its console output so that the parent can print it in order.
+
+    Returns the number of elements added or changed, the console output, the file's profile if profiling, and the
+    change log if it is a dry run.
+    """
+    profile = FileProfile(file) if profiling else None
+    change_log = [] if dry_run else None
+
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        new_elements_counter = process_file(file, stages, path_from, path_to, stream, profile, change_log, verify, source_hash, prefilter)
+
+    return new_elements_counter, output.getvalue(), profile.to_dict() if profile else None, change_log
+
+def process_headwords(files: list[str], stages: list[str], path_from: str, path_to: str, first: str, last: str=None, dry_run: bool=False, verify: bool=True) -> Iterator[tuple[str, int, list[dict]]]:
+    """Process the entries with the headword 'first' (or from 'first' to 'last') and splice each into the output of an
+    earlier run, without parsing the rest of the file.
+
+    The entries are found with the entry index of the source and output files, and their bytes are sliced from the
+    memory-mapped source file. Each is processed with the author in force before it, and replaces the entry in the same
+    position in the output file. The text between entries is not processed. An output file is only spliced if the
+    manifest records that it was made by the same stages, so that its other entries and the new ones agree.
+
+    Yields (file, the number of elements added or changed, the change log) for each file with such entries.
+    """
+    pipeline = Pipeline(stages, verify)
+    manifest = load_manifest(path_to)
+
+    with closing(open_entry_index(None if dry_run else path_to)) as connection:
+        for file in files:
+            update_entry_index(connection, path_from + file)
+
+        try:
+            entries = find_entries(connection, [path_from + file for file in files], first, last)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return
+
+        for file in files:
+            source_entries = entries.get(path_from + file)
+
+            if not source_entries:
+                continue
+
+            output_path = path_to + file
+
+            if not os.path.exists(output_path):
+                print(f"ERROR: {output_path} does not exist; process the whole of {file} first")
+                continue
+
+            manifest_entry = manifest["files"].get(file)
+
+            if manifest_entry is None:
+                print(f"ERROR: the manifest has no record of how {output_path} was made; process the whole of {file} first")
+                continue
+
+            if manifest_entry["stages"] != stages:
+                print(f"ERROR: {output_path} was made by the stages {','.join(manifest_entry['stages'])}, not {','.join(stages)}; use the same mode, or process the whole of {file} again")
+                continue
+
+            update_entry_index(connection, output_path)
+            output_entries = load_entry_offsets(connection, output_path)
+
+            if len(output_entries) != count_entries(connection, path_from + file):
+                print(f"ERROR: {output_path} does not have the same entries as {file}; process the whole of {file} again")
+                continue
+
+            log(f"{file}: {len(source_entries)} entries in progress")
+
+            new_elements_counter = 0
+            change_log = []
+            new_entries = {}
+
+            with map_source(path_from + file) as data:
+                for entry in source_entries:
+                    new_entry, result = pipeline.process_bytes(data[entry.start:entry.end], entry.incoming_author)
+                    new_elements_counter += result.new_elements
+                    change_log.extend(result.changes)
+                    report_changed_text(file, result.changed_headwords)
+                    new_entries[entry.position] = new_entry
+
+            if not dry_run:
+                splice_entries(connection, output_path, output_entries, new_entries)
+
+            log(f"{file}: done!")
+
+            yield file, new_elements_counter, change_log
+
+def report_changed_text(file: str, headwords: list[str], profile: FileProfile=None) -> None:
+    """Print a warning for each entry whose text has been changed; the run carries on."""
+    for headword in headwords:
+        print(f"WARNING: the text of {headword} in {file} has been changed during the process!")
+
+    if profile:
+        profile.count("entries_text_changed", len(headwords))
+
+def write_change_log(f, file: str, change_log: list[dict]) -> None:
+    """Write each record of a file's change log to 'f' as a line of JSON."""
+    for record in change_log:
+        f.write(json.dumps({"file": file, **record}, ensure_ascii=False) + "\n")
+
+    f.flush()
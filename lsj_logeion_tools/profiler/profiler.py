@@ -0,0 +1,71 @@
+import json, resource, time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# The stages of processing a file, in the order they are reported. A file is read as it is parsed and serialised as it
+# is written, so reading is part of "parse", and serialising part of "write"
+profile_stages = ["parse", "index", "scan", "transform", "verify", "write", "stream"]
+
+class FileProfile:
+    """Wall time per stage and counters for the processing of a single file."""
+
+    def __init__(self, file: str):
+        self.file = file
+        self.stage_times = Counter()
+        self.counters = Counter()
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the wall time of the 'with' block to the stage 'name'."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] += time.perf_counter() - start
+
+    def count(self, name: str, value: int=1) -> None:
+        self.counters[name] += value
+
+    def to_dict(self) -> dict:
+        return {
+            "file": self.file,
+            "seconds": time.perf_counter() - self.start,
+            "stages": {name: self.stage_times[name] for name in profile_stages if name in self.stage_times},
+            "counters": dict(sorted(self.counters.items())),
+            # the peak resident memory of the process which handled the file, up to the end of the file
+            "peak_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+def profile_stage(profile: FileProfile | None, name: str):
+    """Return profile.stage(name), or a context manager which does nothing if there is no profile."""
+    if profile is None:
+        return nullcontext()
+
+    return profile.stage(name)
+
+def make_report(file_profiles: list[dict], seconds: float) -> dict:
+    """Combine the profiles of each file into the report of a run."""
+    stages = Counter()
+    counters = Counter()
+
+    for file_profile in file_profiles:
+        stages.update(file_profile["stages"])
+        counters.update(file_profile["counters"])
+
+    peak_memory_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+    return {
+        "seconds": seconds,
+        "peak_memory_kb": peak_memory_kb,
+        "stages": {name: stages[name] for name in profile_stages if name in stages},
+        "counters": dict(sorted(counters.items())),
+        "files": file_profiles,
+    }
+
+def save_report(path: str, report: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
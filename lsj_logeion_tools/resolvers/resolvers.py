@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+from typing import Callable, NamedTuple
+from utilities.utilities import *
+
+# RESOLVERS
+
+class Resolver(NamedTuple):
+    """How the references to one cited author are found in the tail of an element and given a TLG work.
+
+    author is the text of the <author> element which the references follow, e.g. "Plu.". pattern matches anything
+    which could be a reference (it is used to decide which entries need scanning at all); has_reference and
+    find_references define the author's reference grammar; and resolve returns the TLG author number, work number and
+    title abbreviation of a reference.
+    """
+    author: str
+    pattern: re.Pattern
+    has_reference: Callable[[str], bool]
+    find_references: Callable[[str], list[Reference]]
+    resolve: Callable[[Reference], tuple[int, int, str]]
+
+# The resolvers by the text of their <author> element
+resolvers = {}
+
+def register_resolver(resolver: Resolver) -> None:
+    """Add a resolver to the registry, replacing any resolver for the same author."""
+    resolvers[resolver.author] = resolver
+
+def get_resolver(author: str | None) -> Resolver | None:
+    """Returns the resolver for the references following an <author>, or None if the author has none."""
+    return resolvers.get(author)
+
+# RANGE TABLES
+
+@lru_cache(maxsize=None)
+def get_work_index(tsv_path: str) -> WorkRangeIndex:
+    """Returns the index of a range table with the columns of moralia_abbreviations.tsv, loading it on first use."""
+    return WorkRangeIndex(load_works_table(tsv_path))
+
+def resolve_stephanus(reference: Reference, work_index: WorkRangeIndex) -> tuple[int, int, str]:
+    """Returns the TLG author, work and abbreviation of the first work in 'work_index' which ends after the reference."""
+    work = work_index.find(reference.ordinal)
+
+    if work is None:
+        raise ValueError(f"stephanus ({reference.stephanus}) is too large for the works of {work_index.works[-1].abbreviation}")
+
+    return (work.author, work.work, work.abbreviation)
+
+def make_range_resolver(author: str, tsv_path: str, volume: str=None) -> Resolver:
+    """Returns a resolver for an author cited by stephanus-style page and section, whose works are listed by range in
+    the TSV file 'tsv_path'.
+
+    'volume' optionally matches the volume which may come before a reference (see make_reference_patterns). A
+    stephanus after the last work in the table is not taken to be a reference to the author.
+    """
+    pattern, split_pattern = make_reference_patterns(volume)
+
+    return Resolver(
+        author,
+        pattern,
+        lambda text: has_reference(text, get_work_index(tsv_path).max_ordinal, pattern),
+        lambda text: find_references(text, get_work_index(tsv_path).max_ordinal, pattern, split_pattern),
+        lambda reference: resolve_stephanus(reference, get_work_index(tsv_path)),
+    )
+
+# Plutarch's Moralia
+register_resolver(Resolver(
+    "Plu.",
+    re_reference,
+    has_reference,
+    find_references,
+    lambda reference: get_tlg_reference(reference.stephanus, get_moralia_table().work_index),
+))
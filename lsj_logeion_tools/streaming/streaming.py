@@ -0,0 +1,106 @@
+from typing import BinaryIO, Callable
+from lxml import etree
+
+def stream_entries(source: BinaryIO, destination: BinaryIO, process_entry: Callable[[etree.Element], int], entry_tag: str="div2") -> int:
+    """Parse 'source' one entry at a time, pass each entry to 'process_entry' and write the result to 'destination'.
+
+    Only the current entry and its open ancestors are held in memory: each entry is written with an incremental writer
+    as soon as it has been processed and is then cleared. The output is the same as serialising the whole root.
+
+    Returns the sum of the values returned by 'process_entry'.
+    """
+    counter = 0
+
+    # The last element (or comment) written, whose tail had not yet been parsed when it was written
+    pending_tail = None
+    # Ancestors of the current position: [element, context manager or None if its start tag is not written yet]
+    open_elements = []
+    entry_depth = 0
+
+    def flush_pending_tail(xf):
+        nonlocal pending_tail
+
+        if pending_tail is None:
+            return
+
+        if pending_tail.tail and open_elements:
+            xf.write(pending_tail.tail)
+
+        clear_element(pending_tail)
+        pending_tail = None
+
+    def open_parent(xf):
+        # Start tags are written once the first child is reached, by which point the text is known; elements without
+        # children are written whole at their end, so that empty elements are still self-closing
+        if not open_elements or open_elements[-1][1] is not None:
+            return
+
+        element = open_elements[-1][0]
+        nsmap = element.nsmap if len(open_elements) == 1 else None
+
+        context = xf.element(element.tag, dict(element.attrib), nsmap=nsmap)
+        context.__enter__()
+        open_elements[-1][1] = context
+
+        if element.text:
+            xf.write(element.text)
+
+    with etree.xmlfile(destination, encoding="utf-8") as xf:
+
+        for event, element in etree.iterparse(source, events=("start", "end", "comment", "pi")):
+
+            if entry_depth:
+                # inside an entry; the whole entry is handled at its end event
+                if event == "start" and element.tag == entry_tag:
+                    entry_depth += 1
+                elif event == "end" and element.tag == entry_tag:
+                    entry_depth -= 1
+
+                if not (event == "end" and element.tag == entry_tag and entry_depth == 0):
+                    continue
+
+                counter += process_entry(element)
+                xf.write(element, with_tail=False)
+                pending_tail = element
+                continue
+
+            flush_pending_tail(xf)
+
+            if event == "start":
+                open_parent(xf)
+
+                if element.tag == entry_tag:
+                    entry_depth = 1
+                    continue
+
+                open_elements.append([element, None])
+
+            elif event == "end":
+                _, context = open_elements.pop()
+
+                if context is None:
+                    xf.write(element, with_tail=False)
+                else:
+                    context.__exit__(None, None, None)
+
+                pending_tail = element
+
+            elif open_elements:
+                # comments and processing instructions outside the entries; those outside the root are dropped
+                open_parent(xf)
+                xf.write(element, with_tail=False)
+                pending_tail = element
+
+    return counter
+
+def clear_element(element: etree.Element) -> None:
+    """Free an element which has already been written, along with any earlier siblings."""
+    element.clear()
+
+    parent = element.getparent()
+
+    if parent is None:
+        return
+
+    while element.getprevious() is not None:
+        del parent[0]
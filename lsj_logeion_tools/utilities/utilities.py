@@ -1,47 +1,127 @@
 import csv, os, re
-import pandas as pd
+from bisect import bisect_right
+from collections import Counter
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Iterable, NamedTuple
 from lxml import etree
 
 # REGEX STRINGS
 
-re_stephanus = r"(\b[1-2]\.[1-9]\d{0,3}[a-f]\b)|(?<!\.)\b([1-9]\d{0,3}[a-f])\b"
+def make_reference_patterns(volume: str=None) -> tuple[re.Pattern, re.Pattern]:
+    """Returns the patterns of a grammar of stephanus references: the first matches anything which could be a
+    reference, and the second is the pattern on which a tail is split around a reference. 'volume' optionally matches
+    the volume which may come before a reference, e.g. the "2." of Plutarch's "2.123a".
+
+    Group 1 of a match of either pattern is the clean stephanus of a reference with a volume, and group 2 of one without.
+    """
+    # without volumes, group 1 never matches
+    volume = r"(?!)" if volume is None else volume
+    stephanus = r"[1-9]\d{0,3}[a-f]"
+
+    return (
+        re.compile(rf"\b{volume}({stephanus})\b|(?<!\.)\b({stephanus})\b"),
+        re.compile(rf"\b{volume}({stephanus})\b|(?<!\d\.)\b({stephanus})\b"),
+    )
+
+# Plutarch's grammar, with wyttenbach (2.123a) and stephanus (345b) references
+re_reference, re_split_reference = make_reference_patterns(r"[1-2]\.")
+
+# clean stephanus references are of the form '1234a'
+re_clean_stephanus = re.compile(r"(?P<page>[1-9]\d{0,3})(?P<section>[a-f])")
+
+stephanus_sections = "abcdef"
 
 max_plutarch_stephanus = "1147a"
 
+# CONSOLE OUTPUT AND PROFILING
+
+# 0: warnings only; 1: the progress of each file; 2: each new element as well
+verbosity = 1
+
+# The number of regular expression searches made by each function, for profiling
+regex_calls = Counter()
+
+def set_verbosity(level: int) -> None:
+    global verbosity
+    verbosity = level
+
+def log(message: str, level: int=1) -> None:
+    """Print a message if the verbosity is at least 'level'."""
+    if verbosity >= level:
+        print(message)
+
+def get_call_counts() -> Counter:
+    """Return the regular expression searches made by each function so far, as "regex_calls:<function>", and the cache
+    hits and misses of stephanus_ordinal, whose misses are its only searches."""
+    call_counts = Counter({f"regex_calls:{function}": calls for function, calls in regex_calls.items()})
+    cache_info = stephanus_ordinal.cache_info()
+    call_counts["stephanus_ordinal_cache:hits"] = cache_info.hits
+    call_counts["stephanus_ordinal_cache:misses"] = cache_info.misses
+
+    return call_counts
+
 # COLLECTION OF REFERENCES
 
 def print_headword(element: etree.Element) -> None:
     """Prints the headword (the dictionary entry) for the current element. Useful for orientating oneself in the 
     lexicon."""
+    headword = get_headword(element)
+
+    if headword is None:
+        return
+
+    print(headword)
+
+def get_headword(element: etree.Element) -> str | None:
+    """Returns the headword (the dictionary entry) for the current element, which may be the entry itself, or None if it
+    is not in an entry."""
     div2 = [ancestor for ancestor in element.iterancestors() if ancestor.tag == "div2"]
 
+    if element.tag == "div2":
+        div2 = [element]
+
     if len(div2) == 0:
-        return
-    
+        return None
+
     head = div2[0].find(".//head")
 
-    print(head.text)
+    return head.text if head is not None else None
 
-def has_reference(text: str) -> bool:
+def make_change_record(stage: str, bibl: etree.Element, old_n: str=None, amendments: dict=None, title: str=None) -> dict:
+    """Returns the record of a change made to a <bibl> element by a stage, for the change log of a dry run."""
+    return {
+        "stage": stage,
+        "headword": get_headword(bibl),
+        "old_n": old_n,
+        "new_n": bibl.get("n"),
+        "amendments": amendments,
+        "title": title,
+    }
+
+def has_reference(text: str, max_ordinal: int=None, pattern: re.Pattern=re_reference) -> bool:
     """Tests if the text input (a string) contains a valid stephanus reference.
     This function is intended to work on the text or tail node of an element, though it will work on any string.
+
+    A reference after 'max_ordinal' (by default the end of Plutarch's Moralia) is not valid. 'pattern' is the first
+    pattern of the grammar (see make_reference_patterns), by default Plutarch's.
     """
     if not text:
         return False
     
     # this regex matches for wyttenbach (2.123a) and stephanus (345b) references
-    re_reference = r"(\b[1-2]\.[1-9]\d{0,3}[a-f]\b)|(?<!\.)\b([1-9]\d{0,3}[a-f])\b"
-
-    match = re.search(re_reference, text)
+    regex_calls["has_reference"] += 1
+    match = pattern.search(text)
     
     if not match:
         return False
     
-    stephanus = clean_stephanus(match[0])
+    stephanus = match[1] or match[2]
+    max_ordinal = max_plutarch_ordinal if max_ordinal is None else max_ordinal
 
     # TODO: This is not enough; it is possible that there would be sufficiently-small, stephanus-like references in the text for, e.g., inscriptional references.
     # Consider testing for <author> elements only, not all elements.
-    if is_larger_stephanus(max_plutarch_stephanus,  stephanus):
+    if stephanus_ordinal(stephanus) > max_ordinal:
         return False
 
     return True
@@ -52,13 +132,56 @@ def get_string_reference(text: str, maxsplit: int=0) -> list[str]:
     maxsplit optionally sets a limit for the numberof references returned and defaults to no limit.
     """
     re_reference = r"(\b[1-2]\.[1-9]\d{0,3}[a-f]\b|(?<!\d\.)\b[1-9]\d{0,3}[a-f])\b"
+    regex_calls["get_string_reference"] += 1
     matches = re.split(re_reference, text, maxsplit)
 
     return matches
 
-def etree_print(element: etree.Element) -> None:
-    """A method for printing the string of an etree.Element to the terminal."""
-    print(etree.tostring(element, encoding="unicode"))
+class Reference(NamedTuple):
+    """A stephanus reference found in a string: its span, its text as found, its clean form and its ordinal."""
+    start: int
+    end: int
+    raw: str
+    stephanus: str
+    ordinal: int
+
+def find_references(text: str, max_ordinal: int=None, pattern: re.Pattern=re_reference, split_pattern: re.Pattern=re_split_reference) -> list[Reference]:
+    """Returns every stephanus reference in the text which is to be wrapped, in order, in a single pass.
+
+    The result is the same as splitting off the first reference with get_string_reference while has_reference finds
+    a valid reference in the rest of the text: 'pattern' decides whether to go on, and 'split_pattern' finds the
+    reference itself. Each pattern's matches are only searched for once, moving forward through the text. The grammar
+    and 'max_ordinal' are as for has_reference, by default Plutarch's.
+    """
+    references = []
+
+    if not text:
+        return references
+
+    regex_calls["find_references"] += 1
+    position = 0
+    max_ordinal = max_plutarch_ordinal if max_ordinal is None else max_ordinal
+    match = pattern.search(text)
+
+    while match:
+        if stephanus_ordinal(match[1] or match[2]) > max_ordinal:
+            break
+
+        # the split pattern always matches at or before the first
+        split_match = split_pattern.search(text, position)
+        stephanus = split_match[1] or split_match[2]
+        references.append(Reference(split_match.start(), split_match.end(), split_match[0], stephanus, stephanus_ordinal(stephanus)))
+        position = split_match.end()
+
+        if match.start() < position:
+            match = pattern.search(text, position)
+
+    return references
+
+def etree_print(element: etree.Element, level: int=0) -> None:
+    """A method for printing the string of an etree.Element to the terminal, if the verbosity is at least 'level'."""
+    if verbosity >= level:
+        print(etree.tostring(element, encoding="unicode"))
 
 # INSERTION OF NEW ELEMENTS
 
@@ -69,6 +192,7 @@ def clean_stephanus(raw_stephanus: str) -> str:
         raise TypeError(f"raw_stephanus is of the wrong type: {type(raw_stephanus)}")
 
     re_wyttenbach_stephanus = r"(?<=\b[1-2]\.)[1-9]\d{0,3}[a-f]\b" # e.g. 2.1234a
+    regex_calls["clean_stephanus"] += 1
     match = re.search(re_wyttenbach_stephanus, raw_stephanus)
 
     if not match:
@@ -80,50 +204,120 @@ def clean_stephanus(raw_stephanus: str) -> str:
 
     return match.group()
 
-def get_tlg_reference(stephanus: str, moralia_df: pd.DataFrame) -> tuple[str, str, str]:
+def get_tlg_reference(stephanus: str, work_index: "WorkRangeIndex") -> tuple[int, int, str]:
+    """Return the author, work and abbreviation of the first work of Plutarch's Moralia which ends after 'stephanus'.
     """
-    """
-    
-    for row in moralia_df.itertuples():
-        if is_larger_stephanus(row.end, stephanus):
-            return (row.author, row.work, row.abbreviation)
-    
-    raise ValueError(f"stephanus ({stephanus}) is too large for Plutarch's Moralia")
+    work = work_index.find(Stephanus.from_string(stephanus).ordinal)
+
+    if work is None:
+        raise ValueError(f"stephanus ({stephanus}) is too large for Plutarch's Moralia")
+
+    return (work.author, work.work, work.abbreviation)
 
 def is_larger_stephanus(larger_ref: str, smaller_ref: str) -> bool:
     """Return True if larger_ref is larger than smaller_ref and vice versa.
     """
-    if not isinstance(larger_ref, str) and not isinstance(smaller_ref, str):
+    if not isinstance(larger_ref, str) or not isinstance(smaller_ref, str):
         raise TypeError(f"one or both of larger_ref ({type(larger_ref)}) and smaller_ref ({type(smaller_ref)}) are not strings")
 
-    # clean stephanus references are of the form '1234a'
-    re_clean_stephanus = r"[1-9]\d{0,3}[a-f]"
-    assert re.fullmatch(re_clean_stephanus, larger_ref), f"larger_ref ('{larger_ref}') is not a clean stephanus reference"
-    assert re.fullmatch(re_clean_stephanus, smaller_ref), f"smaller_ref ('{smaller_ref}') is not a clean stephanus reference"
-
-    page1, section1 = split_stephanus(larger_ref)
-    page2, section2 = split_stephanus(smaller_ref)
+    larger_ordinal = stephanus_ordinal(larger_ref)
+    smaller_ordinal = stephanus_ordinal(smaller_ref)
 
-    if page1 == page2:
-        return section1 > section2
+    assert larger_ordinal is not None, f"larger_ref ('{larger_ref}') is not a clean stephanus reference"
+    assert smaller_ordinal is not None, f"smaller_ref ('{smaller_ref}') is not a clean stephanus reference"
 
-    return page1 > page2
+    return larger_ordinal > smaller_ordinal
 
 def is_between(stephanus: str, start: str, end: str) -> bool:
     """Return True if a stephanus reference is greater than 'start' and less than 'end'; false otherwise."""
     return is_larger_stephanus(stephanus, start) and is_larger_stephanus(end, stephanus)
 
-def get_moralia_info(work: str, author: str) -> pd.DataFrame:
-    """Return a DataFrame of the row in Plutarch's Moralia which matches the given work and author references."""
-    global moralia_abbreviations
+@lru_cache(maxsize=None)
+def stephanus_ordinal(stephanus: str) -> int | None:
+    """Return a clean stephanus reference (e.g. '1234a') as a sortable integer: page * 6 + section.
+
+    Returns None if 'stephanus' is not a clean stephanus reference.
+    """
+    match = re_clean_stephanus.fullmatch(stephanus)
+
+    if not match:
+        return None
+
+    return int(match["page"]) * 6 + stephanus_sections.index(match["section"])
+
+class Stephanus(NamedTuple):
+    """A clean stephanus reference held as its ordinal, so that references compare and sort as integers.
+
+    e.g. Stephanus.from_string('512b').ordinal -> 3073
+    e.g. str(Stephanus(3073)) -> '512b'
+    """
+    ordinal: int
+
+    @classmethod
+    def from_string(cls, stephanus: str) -> "Stephanus":
+        ordinal = stephanus_ordinal(stephanus)
+
+        if ordinal is None:
+            raise ValueError(f"stephanus ({stephanus}) is not a clean stephanus reference")
+
+        return cls(ordinal)
+
+    @property
+    def page(self) -> int:
+        return self.ordinal // 6
+
+    @property
+    def section(self) -> str:
+        return stephanus_sections[self.ordinal % 6]
+
+    def __str__(self) -> str:
+        return f"{self.page}{self.section}"
+
+class WorkRangeIndex:
+    """The works of a range table, e.g. Plutarch's Moralia, sorted by the ordinal of their last stephanus for bisect-based
+    lookups.
+
+    'works' are rows with 'author', 'work', 'end' and 'abbreviation' fields, in the order of the Moralia.
+    """
+    __slots__ = ("ends", "works")
+
+    def __init__(self, works: Iterable[tuple]):
+        self.ends = []
+        self.works = []
+
+        for work in works:
+            end = Stephanus.from_string(work.end).ordinal
+
+            # a work which ends no later than an earlier one is never the first to end after a stephanus
+            if self.ends and end <= self.ends[-1]:
+                continue
+
+            self.ends.append(end)
+            self.works.append(work)
+
+    @property
+    def max_ordinal(self) -> int:
+        """The last stephanus ordinal for which find returns a work."""
+        return self.ends[-1] - 1 if self.ends else -1
+
+    def find(self, ordinal: int) -> tuple | None:
+        """Return the first work which ends after the stephanus 'ordinal', or None if there is no such work."""
+        index = bisect_right(self.ends, ordinal)
+
+        if index == len(self.works):
+            return None
+
+        return self.works[index]
+
+def get_moralia_info(work: str, author: str) -> "MoraliaWork | None":
+    """Return the work in Plutarch's Moralia which matches the given work and author references, or None."""
     work = int(work)
     author = int(author)
-    df_work = moralia_abbreviations.query(f"(work == {work}) and (author == {author})")
-    return df_work
+    return get_moralia_table().get(author, work)
 
-def get_stephanus_range(work: pd.DataFrame) -> tuple[str, str]:
+def get_stephanus_range(work: "MoraliaWork") -> tuple[str, str]:
     """Return the stephanus refernces for the start and end of a particular work from Plutarch's Moralia"""
-    return (work["start"].iloc[0], work["end"].iloc[0])
+    return (work.start, work.end)
 
 def split_stephanus(stephanus: str) -> tuple[int, str]:
     """Split a simple stephanus reference str to return a tuple of the page and section.
@@ -153,6 +347,7 @@ def parse_n_attribute(n_attribute: str) -> tuple[str, str, str]:
     """
 
     re_n_attribute = r"Perseus:abo:tlg,(?P<author>0007|0094),(?P<work>\d{3}):(?P<stephanus>\d{1,4}[abcdef])"
+    regex_calls["parse_n_attribute"] += 1
     match = re.fullmatch(re_n_attribute, n_attribute)
 
     if match is None:
@@ -166,10 +361,7 @@ def get_previous_tag(tag: str, target_element: etree.Element, search_top="div1")
     
     search_top is the highest level of the tree in which to conduct the search."""
     
-    parent = target_element.getparent()
-
-    while parent.getparent() is not None and parent.getparent().tag != search_top:
-        parent = parent.getparent()
+    parent = get_search_scope(target_element, search_top)
 
     previous_title = None
 
@@ -181,16 +373,77 @@ def get_previous_tag(tag: str, target_element: etree.Element, search_top="div1")
 
     return previous_title
 
+def get_search_scope(target_element: etree.Element, search_top="div1") -> etree.Element:
+    """Return the element within which get_previous_tag searches for elements before 'target_element': the ancestor
+    immediately below search_top, or search_top itself if it is the parent of 'target_element'."""
+    parent = target_element.getparent()
+
+    while parent.tag != search_top and parent.getparent() is not None and parent.getparent().tag != search_top:
+        parent = parent.getparent()
+
+    return parent
+
 # Loading Moralia data
 
-def load_moralia_abbreviations() -> pd.DataFrame:
+class MoraliaWork(NamedTuple):
+    """A row of moralia_abbreviations.tsv."""
+    author: int
+    work: int
+    start: str
+    end: str
+    greek_title: str
+    latin_title: str
+    abbreviation: str
+
+class MoraliaTable:
+    """An immutable table of the works of Plutarch's Moralia, indexed for the lookups made for every element.
+
+    'works' are in the order of the Moralia.
+    """
+    __slots__ = ("works", "by_author_and_work", "valid_works", "work_index")
+
+    def __init__(self, works: Iterable[MoraliaWork]):
+        works = tuple(works)
+
+        object.__setattr__(self, "works", works)
+        object.__setattr__(self, "by_author_and_work", MappingProxyType({(w.author, w.work): w for w in works}))
+        object.__setattr__(self, "valid_works", frozenset(w.work for w in works))
+        object.__setattr__(self, "work_index", WorkRangeIndex(works))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def get(self, author: int, work: int) -> MoraliaWork | None:
+        """Return the work with the given TLG author and work numbers, or None."""
+        return self.by_author_and_work.get((author, work))
+
+def get_moralia_abbreviations_path() -> str:
+    """Return the path of moralia_abbreviations.tsv."""
     script_path = os.path.abspath(__file__)
     script_dir = os.path.dirname(script_path)
 
-    tsv_path = os.path.join(script_dir, "../resources/moralia_abbreviations.tsv")
-    
-    df = pd.read_csv(tsv_path, sep="\t")
-    
-    return df
+    return os.path.join(script_dir, "../resources/moralia_abbreviations.tsv")
+
+def load_moralia_abbreviations() -> MoraliaTable:
+    return MoraliaTable(load_works_table(get_moralia_abbreviations_path()))
+
+def load_works_table(tsv_path: str) -> list[MoraliaWork]:
+    """Return the rows of a table of works by stephanus range, with the columns of moralia_abbreviations.tsv."""
+    with open(tsv_path, newline="", encoding="utf-8") as tsv_file:
+        reader = csv.reader(tsv_file, delimiter="\t")
+        next(reader) # header
+
+        return [
+            MoraliaWork(int(author), int(work), start, end, greek_title, latin_title, abbreviation)
+            for author, work, start, end, greek_title, latin_title, abbreviation in reader
+        ]
+
+@lru_cache(maxsize=None)
+def get_moralia_table() -> MoraliaTable:
+    """Return the table of Plutarch's Moralia, loading it on first use."""
+    return load_moralia_abbreviations()
 
-moralia_abbreviations = load_moralia_abbreviations()
\ No newline at end of file
+max_plutarch_ordinal = stephanus_ordinal(max_plutarch_stephanus)
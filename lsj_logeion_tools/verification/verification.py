@@ -0,0 +1,23 @@
+import hashlib
+from lxml import etree
+from utilities.utilities import get_headword
+
+# The transformations only ever add <title> text and whitespace around new elements; the rest of the text of each entry
+# must be preserved.
+
+# the text nodes of an entry in document order, except for the text of <title> elements
+entry_text = etree.XPath("descendant::text()[not(parent::title)]", smart_strings=False)
+
+def hash_entry_text(entry: etree.Element) -> bytes:
+    """Return a hash of the text of an entry, leaving out the text of <title> elements and all whitespace."""
+    text = "".join(entry_text(entry))
+
+    return hashlib.blake2b("".join(text.split()).encode("utf-8"), digest_size=16).digest()
+
+def hash_entries(root: etree.Element, entry_tag: str="div2") -> list[tuple[etree.Element, bytes]]:
+    """Return each entry in 'root', which may itself be an entry, with the hash of its text."""
+    return [(entry, hash_entry_text(entry)) for entry in root.iter(entry_tag)]
+
+def get_changed_headwords(hashed_entries: list[tuple[etree.Element, bytes]]) -> list[str]:
+    """Return the headwords of the entries whose text has changed since they were hashed by hash_entries."""
+    return [get_headword(entry) for entry, text_hash in hashed_entries if hash_entry_text(entry) != text_hash]
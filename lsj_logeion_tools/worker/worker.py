@@ -0,0 +1,95 @@
+import argparse, contextlib, json, os, socketserver, sys
+from typing import TextIO
+from pipeline.pipeline import Pipeline, parse_stages
+
+def handle_request(pipeline: Pipeline, request: dict) -> dict:
+    """Run the pipeline on the XML of one request and return the reply.
+
+    A request is {"xml": ..., "last_author": ..., "id": ...}, where only "xml" is required; "id" is copied to the reply
+    so that a client can match replies to requests. A request which cannot be processed gets a reply with an "error".
+    """
+    reply = {"id": request.get("id")} if "id" in request else {}
+
+    try:
+        xml, result = pipeline.process_bytes(request["xml"].encode("utf-8"), request.get("last_author"))
+    except Exception as e:
+        reply["error"] = f"{type(e).__name__}: {e}"
+        return reply
+
+    reply.update({
+        "xml": xml.decode("utf-8"),
+        "new_elements": result.new_elements,
+        "changes": result.changes,
+        "changed_headwords": result.changed_headwords,
+        "last_author": result.last_author,
+    })
+
+    return reply
+
+def handle_line(pipeline: Pipeline, line: str) -> str:
+    """Return the JSON reply to a JSON request on a single line."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return json.dumps({"error": f"invalid request: {e}"}, ensure_ascii=False)
+
+    if not isinstance(request, dict) or not isinstance(request.get("xml"), str):
+        return json.dumps({"error": "invalid request: expected an object with an \"xml\" string"}, ensure_ascii=False)
+
+    return json.dumps(handle_request(pipeline, request), ensure_ascii=False)
+
+def serve_stream(pipeline: Pipeline, requests: TextIO, replies: TextIO) -> None:
+    """Reply to each line of 'requests' with a line on 'replies', until the end of 'requests'."""
+    for line in requests:
+        if not line.strip():
+            continue
+
+        replies.write(handle_line(pipeline, line) + "\n")
+        replies.flush()
+
+def serve_socket(pipeline: Pipeline, path: str) -> None:
+    """Accept connections on the Unix socket 'path', replying to each line a client sends, until interrupted."""
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+
+                self.wfile.write(handle_line(pipeline, line.decode("utf-8")).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    with socketserver.UnixStreamServer(path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the pipeline loaded and apply it to entries sent as JSON lines on stdin or a Unix socket.")
+    parser.add_argument("stages", nargs="?", default="all", type=parse_stages, help="id, add, amend, all (the default), or a comma-separated list such as add,amend")
+    parser.add_argument("--socket", help="listen on this Unix socket rather than reading stdin")
+    parser.add_argument("--no-verify", dest="verify", action="store_false", help="do not report entries whose text outside of titles was changed")
+    arguments = parser.parse_args()
+
+    pipeline = Pipeline(arguments.stages, arguments.verify)
+
+    if arguments.socket:
+        print(f"listening on {arguments.socket}", file=sys.stderr)
+
+        try:
+            serve_socket(pipeline, arguments.socket)
+        except KeyboardInterrupt:
+            pass
+    else:
+        replies = sys.stdout
+
+        # anything else printed while processing must not be mixed with the replies
+        with contextlib.redirect_stdout(sys.stderr):
+            serve_stream(pipeline, sys.stdin, replies)
+
+if __name__ == "__main__":
+    main()
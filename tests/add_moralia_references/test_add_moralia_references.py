@@ -1,5 +1,5 @@
 import csv, unittest
-from LSJLogeion_tools.add_moralia_references.add_moralia_references import *
+from lsj_logeion_tools.add_moralia_references.add_moralia_references import *
 
 # TODO: Test that the input string (without XML) is the same length as the output string 
 
@@ -35,17 +35,11 @@ class TestCleanStephanus(unittest.TestCase):
 
 class TestGetTLGReference(unittest.TestCase):
     def setUp(self):
-        self.csv_rows = []
-        path = os.path.join(os.getcwd(), "LSJLogeion_tools", "plutarch_stephanus_tlg_references.csv")
-        with open(path) as csv_file:
-            csv_reader = csv.reader(csv_file)
-            fields = next(csv_reader)
-            for row in csv_reader:
-                self.csv_rows.append(row)
+        self.work_index = get_moralia_table().work_index
 
     def test_input_stephanus_too_large(self):
         with self.assertRaises(ValueError):
-            get_tlg_reference("9999b", self.csv_rows)
+            get_tlg_reference("9999b", self.work_index)
 
     def test_input_incorrect_type(self):
         incorrect_inputs = [
@@ -57,7 +51,7 @@ class TestGetTLGReference(unittest.TestCase):
         ]
         for incorrect_input in incorrect_inputs:
             with self.assertRaises(TypeError):
-                get_tlg_reference(incorrect_input, self.csv_rows)
+                get_tlg_reference(incorrect_input, self.work_index)
 
 class TestIsLargerStephanus(unittest.TestCase):
     def test_input_incorrect_stephanus(self):
@@ -88,5 +82,44 @@ class TestIsLargerStephanus(unittest.TestCase):
             with self.assertRaises(TypeError):
                 is_larger_stephanus(incorrect_input[0], incorrect_input[1])
 
+class TestGetPlutarchElements(unittest.TestCase):
+    def test_post_order_author(self):
+        # the <author> inside the <cit> is seen before the tail of the <cit> is checked
+        root = etree.fromstring("<div2><cit><author>Plu.</author> 2.123a</cit> 345b<bibl><author>Plu.</author> 2.37b</bibl> 456c</div2>")
+        cit, bibl = root.find("cit"), root.find("bibl")
+
+        self.assertEqual(get_plutarch_elements(root), [cit.find("author"), cit, bibl])
+
+    def test_last_author_carried_between_calls(self):
+        first = etree.fromstring("<div2><author>Plu.</author></div2>")
+        second = etree.fromstring("<div2><head>x</head> 2.123a</div2>")
+        last_author = {"author": None}
+
+        get_plutarch_elements(first, last_author)
+        self.assertEqual(get_plutarch_elements(second, last_author), [second.find("head")])
+        self.assertEqual(get_plutarch_elements(second), [])
+
+    def test_deep_tree(self):
+        root = etree.Element("div2")
+        element = root
+        for _ in range(5000):
+            element = etree.SubElement(element, "sense")
+        author = etree.SubElement(element, "author")
+        author.text = "Plu."
+        author.tail = " 2.123a"
+
+        self.assertEqual(get_plutarch_elements(root), [author])
+
+class TestWrapReferences(unittest.TestCase):
+    def test_all_references_wrapped(self):
+        root = etree.fromstring("<div2><author>Plu.</author> 2.1a, 37b; 1148a</div2>")
+        author = root.find("author")
+
+        new_elements = wrap_references(author)
+
+        self.assertEqual(root.findall("bibl"), new_elements)
+        self.assertEqual([bibl.get("n") for bibl in new_elements], ["Perseus:abo:tlg,0007,067:1a", "Perseus:abo:tlg,0007,069:37b"])
+        self.assertEqual(etree.tostring(root, encoding="unicode"), '<div2><author>Plu.</author> <bibl n="Perseus:abo:tlg,0007,067:1a"><title>Lib. educ.</title> 2.1a</bibl>, <bibl n="Perseus:abo:tlg,0007,069:37b"><title>Aud.</title> 37b</bibl>; 1148a</div2>')
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import types
 from lxml import etree
+import lsj_logeion_tools.amend_moralia_references.amend_moralia_references as amend_moralia_references
 
 from lsj_logeion_tools.amend_moralia_references.amend_moralia_references import *
 from lsj_logeion_tools.utilities.utilities import *
@@ -17,4 +18,65 @@ div2.append(bibl_wrong_author_tlg_ref)
 
 def test_process_moralia_bibl():
     assert process_moralia_bibl(bibl1)
-    assert not process_moralia_bibl(bibl_wrong_author_tlg_ref)
\ No newline at end of file
+    assert not process_moralia_bibl(bibl_wrong_author_tlg_ref)
+
+def test_process_moralia_bibls_reuses_new_titles():
+    entry = etree.fromstring(
+        '<div2><sense><bibl n="Perseus:abo:tlg,0007,089:352a"><author>Plu.</author> 2.352a</bibl>, '
+        '<bibl n="Perseus:abo:tlg,0007,089:353a">353a</bibl></sense>'
+        '<sense><bibl n="Perseus:abo:tlg,0007,089:354a">354a</bibl></sense></div2>'
+    )
+    first, second, third = entry.findall(".//bibl")
+
+    assert process_moralia_bibls([first, second, third]) == [first, third]
+    assert first.find("title").text == "[Isid.]"
+    # the title added to the first <bibl> serves for the second, but not for the third, which is in another sense
+    assert second.find("title") is None
+    assert third.find("title").text == "[Isid.]"
+
+def test_process_moralia_bibls_change_log():
+    entry = etree.fromstring(
+        '<div2><head>λέξις</head><bibl n="Perseus:abo:tlg,0007,089:352a"><author>Plu.</author> 2.353a</bibl>, '
+        '<bibl n="Perseus:abo:tlg,0007,089:354a"><title>[Isid.]</title> 354a</bibl></div2>'
+    )
+    change_log = []
+
+    process_moralia_bibls(get_moralia_bibls(entry), change_log=change_log)
+
+    assert len(change_log) == 1
+    assert change_log[0]["headword"] == "λέξις"
+    assert change_log[0]["old_n"] == "Perseus:abo:tlg,0007,089:352a"
+    assert change_log[0]["new_n"] == "Perseus:abo:tlg,0007,089:353a"
+    assert change_log[0]["title"] == "[Isid.]"
+    assert change_log[0]["amendments"]["n_stephanus_doesnt_match"]
+    assert change_log[0]["amendments"]["title_element_needed_post_author"]
+
+def test_check_moralia_bibls():
+    entry = etree.fromstring(
+        '<div2><bibl n="Perseus:abo:tlg,0007,089:352a"><title>Isid.</title> 2.352a</bibl>'
+        '<bibl n="Perseus:abo:tlg,0007,089:352a"><title>Isid.</title> 2.353a</bibl>'
+        '<bibl n="Perseus:abo:tlg,0007,067:37b"><title>Lib. educ.</title> 37c</bibl>'
+        '<bibl n="Perseus:abo:tlg,0094,089:352a">352a</bibl></div2>'
+    )
+    correct, wrong_stephanus, wrong_work, no_work = check_moralia_bibls(entry.findall("bibl"))
+
+    assert not correct.needs_amending()
+    assert wrong_stephanus.n_stephanus_doesnt_match and not wrong_stephanus.n_stephanus_not_in_work_range
+    assert wrong_stephanus.new_n_attribute == "Perseus:abo:tlg,0007,089:353a"
+    assert wrong_work.n_stephanus_doesnt_match and wrong_work.n_stephanus_not_in_work_range
+    assert wrong_work.new_n_attribute == "Perseus:abo:tlg,0007,069:37c"
+    assert no_work.moralia_work is None and not no_work.needs_amending()
+
+    # nothing in the tree is changed until the bibls are amended
+    assert entry.find("bibl[2]").get("n") == "Perseus:abo:tlg,0007,089:352a"
+
+def test_check_work_ranges_without_numpy(monkeypatch):
+    table = get_moralia_table()
+    ordinals = list(range(0, stephanus_ordinal("1147a"), 7))
+    rows = [ordinal % len(table.works) for ordinal in ordinals]
+    rows[::5] = [-1] * len(rows[::5])
+
+    vectorised = check_work_ranges(ordinals, rows)
+    monkeypatch.setattr(amend_moralia_references, "get_numpy", lambda: None)
+
+    assert check_work_ranges(ordinals, rows) == vectorised
@@ -0,0 +1,76 @@
+from lxml import etree
+from lsj_logeion_tools.annotation.annotation import *
+from lsj_logeion_tools.utilities.utilities import get_previous_tag
+
+entry_xml = (
+    '<div2><head>a</head> <author>Plu.</author> 2.1a <author>Id.</author> 2.2b '
+    '<sense><cit><author>Hom.</author> Il. 1</cit> 3c <bibl n="x"><title>A</title> 1a<hi>b</hi></bibl></sense>'
+    '<sense><title>A</title><bibl/><title>B</title><cit><bibl/></cit></sense></div2>'
+)
+
+def test_annotate():
+    entry = etree.fromstring(entry_xml)
+    last_author = {"author": "Ar."}
+    annotations = annotate(entry, last_author)
+    plutarch, id, homer = entry.iter("author")
+    cit = entry.find(".//cit")
+
+    # "Id." resolves to the author before it
+    assert annotations.author(entry.find("head")) == "Ar."
+    assert annotations.author(plutarch) == annotations.author(id) == "Plu."
+    assert last_author["author"] == "Hom."
+
+    tail_authors = dict(zip(annotations.tail_order, annotations.tail_authors))
+    assert annotations.tail_order[-1] is entry
+    assert tail_authors[id] == "Plu."
+
+    # the tail of an element comes after the <author> elements within it
+    assert annotations.author(cit) == "Plu."
+    assert tail_authors[cit] == "Hom."
+
+    tail_inside_bibl = dict(zip(annotations.tail_order, annotations.tail_inside_bibl))
+    bibl = entry.find(".//bibl")
+    assert not tail_inside_bibl[bibl]
+    assert tail_inside_bibl[bibl.find("hi")]
+    assert not tail_inside_bibl[entry.findall("sense")[1]]
+
+    # without the tails, the authors, <bibl> and <title> elements are the same
+    without_tails = annotate(entry, {"author": "Ar."}, tails=False)
+    assert without_tails.tail_order == []
+    assert without_tails.author_texts == annotations.author_texts
+    assert without_tails.bibls.values() == annotations.bibls.values()
+
+def test_previous_title():
+    entry = etree.fromstring(entry_xml)
+    annotations = annotate(entry)
+    bibls = entry.findall(".//bibl")
+
+    for bibl in bibls:
+        assert annotations.previous_title(bibl) is get_previous_tag("title", bibl, "div2")
+
+    # a new <title> is found for the elements after it
+    new_title = etree.SubElement(bibls[1], "title")
+    new_title.text = "C"
+    annotations.insert([new_title])
+
+    assert annotations.previous_title(bibls[2]).text == "B"
+    assert annotations.previous_title(new_title).text == "A"
+
+def test_insert():
+    entry = etree.fromstring(entry_xml)
+    annotations = annotate(entry)
+    id = list(entry.iter("author"))[1]
+
+    # two new <bibl> elements after "Id."
+    new_bibls = [etree.fromstring('<bibl><title>T1</title></bibl>'), etree.fromstring('<bibl><title>T2</title></bibl>')]
+    parent = id.getparent()
+    index = parent.index(id) + 1
+
+    for number, new_bibl in enumerate(new_bibls):
+        parent.insert(index + number, new_bibl)
+
+    annotations.insert(new_bibls)
+
+    assert annotations.author(new_bibls[1]) == annotations.author(new_bibls[0].find("title")) == "Plu."
+    assert annotations.previous_title(new_bibls[1]).text == "T1"
+    assert annotations.bibls.values() == list(entry.iter("bibl"))
@@ -0,0 +1,20 @@
+from lxml import etree
+
+from lsj_logeion_tools.benchmarks.corpus_generator import *
+
+def test_generate_corpus_is_seeded(tmp_path):
+    first = generate_corpus(str(tmp_path / "first"), files=2, entries=50, seed=1)
+    second = generate_corpus(str(tmp_path / "second"), files=2, entries=50, seed=1)
+
+    assert first == second == ["greatscott01.xml", "greatscott02.xml"]
+    for file_name in first:
+        assert (tmp_path / "first" / file_name).read_bytes() == (tmp_path / "second" / file_name).read_bytes()
+
+def test_generate_corpus_is_lsj_like(tmp_path):
+    generate_corpus(str(tmp_path), files=1, entries=200, seed=1)
+    root = etree.parse(str(tmp_path / "greatscott01.xml")).getroot()
+
+    assert len(root.findall(".//div1/div2")) == 200
+    assert root.xpath(".//author[text()='Plu.']")
+    assert root.xpath(".//bibl[starts-with(@n, 'Perseus:abo:tlg,0007')]")
+    assert any("Id." in element.tail for element in root.iter() if element.tail)
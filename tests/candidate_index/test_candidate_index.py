@@ -0,0 +1,63 @@
+from lxml import etree
+from lsj_logeion_tools.candidate_index.candidate_index import *
+
+def make_root():
+    return etree.fromstring(
+        "<TEI.2><text><div1><head>Α</head>"
+        "<div2><head>α</head><author>Plu.</author> Per. 1</div2>"
+        "<div2><head>β</head> 2.123a</div2>"
+        "<div2><head>γ</head><author>Hdt.</author> 1.2a</div2>"
+        '<div2><head>δ</head><bibl n="Perseus:abo:tlg,0007,089:352a">352a</bibl></div2>'
+        "</div1></text></TEI.2>"
+    )
+
+def test_scan_file():
+    file_candidates = scan_file(make_root())
+
+    assert file_candidates.entries == 4
+    assert file_candidates.outside is False
+    assert list(file_candidates.candidates) == [0, 1, 2, 3]
+
+    # β has no <author> of its own, but follows one for Plutarch
+    assert file_candidates.candidates[1].incoming_author == "Plu."
+    assert file_candidates.candidates[1].is_candidate(["add"])
+    # γ's reference may come before its <author>
+    assert file_candidates.candidates[2].is_candidate(["add"])
+    assert not file_candidates.candidates[2].is_candidate(["amend"])
+    assert file_candidates.candidates[3].is_candidate(["amend"])
+    assert not file_candidates.candidates[3].is_candidate(["add"])
+
+def test_select_entries():
+    root = make_root()
+    entries = list(root.iter("div2"))
+
+    assert select_entries(root, scan_file(root), ["add", "amend"]) == [(entries[1], "Plu."), (entries[2], "Plu."), (entries[3], "Hdt.")]
+    assert select_entries(root, scan_file(root), ["amend"]) == [(entries[3], "Hdt.")]
+
+    root.find(".//head").tail = " 2.123a"
+    assert scan_file(root).outside
+    assert select_entries(root, scan_file(root), ["add"]) is None
+
+def test_index(tmp_path):
+    root = make_root()
+    path_to = str(tmp_path)
+
+    with closing(open_index(path_to)) as connection:
+        assert load_candidates(connection, "hash") is None
+
+    file_candidates = get_file_candidates(path_to, "hash", root)
+
+    with closing(open_index(path_to)) as connection:
+        assert load_candidates(connection, "hash") == file_candidates
+
+    # a resolver registered since the file was indexed could make other entries candidates
+    resolvers["Pl."] = resolvers["Plu."]._replace(author="Pl.")
+
+    try:
+        with closing(open_index(path_to)) as connection:
+            assert load_candidates(connection, "hash") is None
+    finally:
+        resolvers.pop("Pl.")
+
+    with closing(open_index(path_to)) as connection:
+        assert load_candidates(connection, "hash") == file_candidates
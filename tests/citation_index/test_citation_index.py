@@ -0,0 +1,30 @@
+from contextlib import closing
+from lsj_logeion_tools.citation_index.citation_index import *
+
+def write_file(path, *bibls):
+    entries = "".join(f'<div2 key="{headword}"><head>{headword}</head> <bibl n="Perseus:abo:tlg,0007,{n}"/></div2>' for headword, n in bibls)
+    path.write_text(f"<TEI.2><text><body><div1>{entries}</div1></body></text></TEI.2>", encoding="utf-8")
+
+def test_citation_index(tmp_path):
+    write_file(tmp_path / "greatscott01.xml", ("α", "089:351c"), ("β", "089:360f"), ("γ", "089:361a"))
+    write_file(tmp_path / "greatscott02.xml", ("δ", "067:1a"), ("ε", "999:351c"))
+
+    with closing(open_citation_index(str(tmp_path / index_name))) as connection:
+        assert update_citation_index(connection, str(tmp_path)) == (2, 0)
+
+        # <bibl> elements with an invalid "n" attribute are not indexed
+        assert [c.headword for c in query_citations(connection)] == ["δ", "α", "β", "γ"]
+        assert [c.headword for c in query_citations(connection, start="351c", end="360f")] == ["α", "β"]
+        assert query_citations(connection, work=67) == [Citation("greatscott02.xml", "δ", 7, 67, "1a", 6)]
+
+        # only the changed file is indexed again, and a file which has gone is removed
+        write_file(tmp_path / "greatscott01.xml", ("α", "089:352a"))
+        (tmp_path / "greatscott02.xml").unlink()
+
+        assert update_citation_index(connection, str(tmp_path)) == (1, 1)
+        assert [(c.headword, c.stephanus) for c in query_citations(connection)] == [("α", "352a")]
+        assert update_citation_index(connection, str(tmp_path)) == (0, 0)
+
+def test_parse_work():
+    assert parse_work("89") == 89
+    assert parse_work("Isid.") == 89
@@ -0,0 +1,81 @@
+from contextlib import closing
+import pytest
+from lxml import etree
+from lsj_logeion_tools.entry_index.entry_index import *
+
+file_xml = (
+    '<TEI.2><text><body><div1><head>A</head> <author>Hom.</author>\n'
+    '<div2 key="a"><head extent="full">&#945;</head> <author>Plu.</author> 2.123a</div2>\n'
+    '<div2 key="b"><sense><head>b</head></sense> <author>Id.</author> 2.123a</div2>\n'
+    '<div2 key="c"/>\n'
+    '<div2 key="a2"><head>α</head> <author/></div2>\n'
+    '</div1></body></text></TEI.2>'
+).encode("utf-8")
+
+def test_scan_entry_offsets():
+    entries = scan_entry_offsets(file_xml)
+
+    assert [(e.position, e.headword, e.incoming_author) for e in entries] == [
+        (0, "α", "Hom."), (1, "b", "Plu."), (2, None, "Plu."), (3, "α", "Plu."),
+    ]
+
+    # each slice is the whole entry, without its tail
+    root = etree.fromstring(file_xml)
+
+    for entry, element in zip(entries, root.iter("div2")):
+        assert etree.tostring(etree.fromstring(file_xml[entry.start:entry.end])) == etree.tostring(element, with_tail=False)
+
+    with pytest.raises(ValueError):
+        scan_entry_offsets(b"<div1><div2><div2></div2></div2></div1>")
+
+    # the same spans without the authors
+    assert scan_entry_spans(file_xml, authors=False) == [(e.start, e.end, None) for e in entries]
+
+def test_find_entries(tmp_path):
+    paths = [str(tmp_path / "greatscott01.xml"), str(tmp_path / "greatscott02.xml")]
+
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(file_xml)
+
+    with closing(open_entry_index(str(tmp_path))) as connection:
+        assert update_entry_index(connection, paths[0])
+        assert update_entry_index(connection, paths[1])
+        assert not update_entry_index(connection, paths[0])
+
+        # every entry with the headword
+        entries = find_entries(connection, paths, "α")
+        assert [(path, [e.position for e in file_entries]) for path, file_entries in entries.items()] == [(paths[0], [0, 3]), (paths[1], [0, 3])]
+
+        # from the first 'b' to the last 'α'
+        entries = find_entries(connection, paths, "b", "α")
+        assert [(path, [e.position for e in file_entries]) for path, file_entries in entries.items()] == [(paths[0], [1, 2, 3]), (paths[1], [0, 1, 2, 3])]
+
+        with pytest.raises(ValueError):
+            find_entries(connection, paths, "ω")
+
+        with pytest.raises(ValueError):
+            find_entries(connection, paths, "α", "ω")
+
+def test_splice_entries(tmp_path):
+    path = str(tmp_path / "greatscott01.xml")
+
+    with open(path, "wb") as f:
+        f.write(file_xml)
+
+    with closing(open_entry_index(str(tmp_path))) as connection:
+        update_entry_index(connection, path)
+        entries = load_entry_offsets(connection, path)
+
+        splice_entries(connection, path, entries, {1: '<div2 key="b"><head>β</head></div2>'.encode("utf-8"), 2: b'<div2 key="c">c</div2>'})
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        assert data == file_xml.replace(
+            b'<div2 key="b"><sense><head>b</head></sense> <author>Id.</author> 2.123a</div2>', '<div2 key="b"><head>β</head></div2>'.encode("utf-8")
+        ).replace(b'<div2 key="c"/>', b'<div2 key="c">c</div2>')
+
+        # the index is up to date with the file, without scanning it again
+        assert not update_entry_index(connection, path)
+        assert [e[:4] for e in load_entry_offsets(connection, path)] == [e[:4] for e in scan_entry_offsets(data)]
@@ -0,0 +1,37 @@
+import gzip, lzma
+import pytest
+from lxml import etree
+from lsj_logeion_tools.file_io.file_io import *
+
+@pytest.mark.parametrize("name, decompress", [("greatscott01.xml", bytes), ("greatscott01.xml.gz", gzip.decompress), ("greatscott01.xml.xz", lzma.decompress)])
+def test_write_and_read_xml(tmp_path, name, decompress):
+    path = str(tmp_path / name)
+    root = etree.fromstring("<TEI.2><div2><head>λέξις</head></div2></TEI.2>")
+
+    write_xml(path, root)
+
+    assert decompress((tmp_path / name).read_bytes()) == etree.tostring(root, encoding="utf-8")
+    assert etree.tostring(read_xml(path)) == etree.tostring(root)
+    assert list(tmp_path.iterdir()) == [tmp_path / name]
+
+def test_open_destination_failure(tmp_path):
+    path = tmp_path / "greatscott01.xml"
+    path.write_bytes(b"<TEI.2/>")
+
+    with pytest.raises(RuntimeError):
+        with open_destination(str(path)) as f:
+            f.write(b"<TEI.2><div2>")
+            raise RuntimeError
+
+    # the old file is untouched and the temporary file is removed
+    assert path.read_bytes() == b"<TEI.2/>"
+    assert list(tmp_path.iterdir()) == [path]
+
+@pytest.mark.parametrize("name", ["greatscott01.xml", "greatscott01.xml.gz", "greatscott01.xml.xz"])
+def test_map_source(tmp_path, name):
+    path = str(tmp_path / name)
+    root = etree.fromstring("<div1><div2>α</div2></div1>")
+    write_xml(path, root)
+
+    with map_source(path) as data:
+        assert data[6:21] == "<div2>α</div2>".encode("utf-8")
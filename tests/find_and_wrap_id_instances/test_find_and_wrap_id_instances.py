@@ -1,6 +1,6 @@
 import unittest
 from lxml import etree
-from LSJLogeion_tools.find_and_wrap_id_instances.find_and_wrap_id_instances import *
+from lsj_logeion_tools.find_and_wrap_id_instances.find_and_wrap_id_instances import *
 
 class TestFindAndWrapIdInstances(unittest.TestCase):
     def test_find_and_wrap_id_instances(self):
@@ -24,12 +24,33 @@ class TestFindAndWrapIdInstances(unittest.TestCase):
             </root>
         """
 
-        result = find_and_wrap_id_instances(input_xml)
-        self.assertEqual(result.strip(), expected_output.strip())
-        expected_output_xml = etree.fromstring(result)
-        
-        result_xml = etree.fromstring(result)
-        self.assertEqual("".join(result_xml.itertext()), "".join(expected_output_xml.itertext()))
+        root = etree.fromstring(input_xml.strip())
+        new_elements = find_and_wrap_id_instances(root)
+
+        # the root is changed in place
+        result = etree.tostring(root, encoding="unicode")
+        self.assertEqual(result, expected_output.strip())
+        self.assertEqual(new_elements, root.findall(".//author"))
+
+        expected_output_xml = etree.fromstring(expected_output.strip())
+        self.assertEqual("".join(root.itertext()), "".join(expected_output_xml.itertext()))
+
+    def test_entry_without_div1(self):
+        entry = etree.fromstring("<div2><author>Plu.</author> 2.123a, Id. 345b</div2>")
+
+        new_elements = find_and_wrap_id_instances(entry)
+
+        self.assertEqual(len(new_elements), 1)
+        self.assertEqual(etree.tostring(entry, encoding="unicode"), "<div2><author>Plu.</author> 2.123a, <author>Id.</author> 345b</div2>")
+
+    def test_every_div1(self):
+        entry = "<div2><author>Plu.</author> x. Id. y</div2>"
+        root = etree.fromstring(f"<body><div1>{entry}</div1><div1>{entry}</div1></body>")
+
+        new_elements = find_and_wrap_id_instances(root)
+
+        self.assertEqual(len(new_elements), 2)
+        self.assertEqual(etree.tostring(root, encoding="unicode"), "<body>" + "<div1><div2><author>Plu.</author> x. <author>Id.</author> y</div2></div1>" * 2 + "</body>")
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os, subprocess, sys
+import pytest
+from lsj_logeion_tools.file_io.file_io import tools_path
+from lsj_logeion_tools.main import *
+
+def test_parse_arguments():
+    arguments = parse_arguments(["add,amend", "source", "destination/"])
+
+    assert arguments.stages == ["add", "amend"]
+    assert arguments.source == os.path.join("source", "")
+    assert arguments.destination == os.path.join("destination", "")
+
+    assert parse_arguments(["all"]).stages == ["id", "add", "amend"]
+    assert parse_arguments(["id"]).source == default_source
+    # the reader and writer threads are opt-in
+    assert parse_arguments(["id"]).prefetch == 0
+
+    # the options can come before the folders
+    arguments = parse_arguments(["all", "--dry-run", "--workers", "2", "source", "destination"])
+    assert (arguments.dry_run, arguments.workers, arguments.destination) == (True, 2, os.path.join("destination", ""))
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["id,bogus"])
+
+def test_run_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["main.py"])
+    main(["corpus", str(tmp_path), "--files", "1", "--entries", "5"])
+
+    assert os.listdir(tmp_path) == ["greatscott01.xml"]
+
+def get_imported_modules(code: str) -> set[str]:
+    """Run 'code' in a new interpreter in the tools' folder, and return the modules it has imported by the end."""
+    code += "\nimport sys; print(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=tools_path, capture_output=True, text=True, check=True).stdout
+
+    return set(output.split())
+
+def test_startup_imports():
+    # the help needs neither the stages nor the code which runs them
+    modules = get_imported_modules("import main\ntry:\n    main.main(['--help'])\nexcept SystemExit:\n    pass")
+    assert not {"processing.processing", "find_and_wrap_id_instances.find_and_wrap_id_instances", "amend_moralia_references.amend_moralia_references"} & modules
+
+    # the id stage alone does not import the others, nor NumPy
+    modules = get_imported_modules("from pipeline.pipeline import Pipeline\nPipeline(['id'])")
+    assert "find_and_wrap_id_instances.find_and_wrap_id_instances" in modules
+    assert not {"add_moralia_references.add_moralia_references", "amend_moralia_references.amend_moralia_references", "numpy"} & modules
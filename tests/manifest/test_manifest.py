@@ -0,0 +1,25 @@
+from lsj_logeion_tools.manifest.manifest import *
+
+def test_is_current(tmp_path):
+    path_to = str(tmp_path)
+    entry = make_manifest_entry("source", "resources", ["add"])
+
+    manifest = load_manifest(path_to)
+    assert not is_current(manifest, "greatscott01.xml", entry, path_to)
+
+    (tmp_path / "greatscott01.xml").write_text("<TEI.2/>")
+    manifest["files"]["greatscott01.xml"] = entry
+    save_manifest(path_to, manifest)
+
+    manifest = load_manifest(path_to)
+    assert is_current(manifest, "greatscott01.xml", entry, path_to)
+    assert not is_current(manifest, "greatscott01.xml", make_manifest_entry("changed", "resources", ["add"]), path_to)
+    assert not is_current(manifest, "greatscott01.xml", make_manifest_entry("source", "resources", ["add", "amend"]), path_to)
+
+def test_hash_file(tmp_path):
+    path = tmp_path / "greatscott01.xml"
+    path.write_bytes(b"<TEI.2/>")
+    first_hash = hash_file(str(path))
+
+    path.write_bytes(b"<TEI.2></TEI.2>")
+    assert hash_file(str(path)) != first_hash
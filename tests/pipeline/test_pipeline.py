@@ -0,0 +1,51 @@
+import pytest
+from lxml import etree
+from lsj_logeion_tools.pipeline.pipeline import *
+
+entry_xml = b'<div2 key="a"><head>a</head> <author>Plu.</author> 2.123a</div2>'
+
+def test_process_bytes():
+    pipeline = Pipeline(["add"])
+    xml, result = pipeline.process_bytes(entry_xml)
+
+    assert xml == b'<div2 key="a"><head>a</head> <author>Plu.</author> <bibl n="Perseus:abo:tlg,0007,077:123a"><title>Sanit.</title> 2.123a</bibl></div2>'
+    assert result.new_elements == 1
+    assert [change["new_n"] for change in result.changes] == ["Perseus:abo:tlg,0007,077:123a"]
+    assert result.changed_headwords == []
+    assert result.last_author == "Plu."
+
+def test_process_entry_last_author():
+    pipeline = Pipeline(["add"])
+    entry = etree.fromstring('<div2 key="b"><head>b</head> 2.123a</div2>')
+
+    # without an author before it, the reference is not Plutarch's
+    assert pipeline.process_entry(entry).new_elements == 0
+
+    result = pipeline.process_entry(entry, last_author="Plu.")
+
+    assert result.new_elements == 1
+    assert entry.find("bibl").get("n") == "Perseus:abo:tlg,0007,077:123a"
+
+def test_process_tree_matches_file():
+    pipeline = Pipeline()
+    file_xml = b'<TEI.2><text><body><div1>' + entry_xml + b'<div2 key="c"><head>c</head> Id. 2.123a</div2></div1></body></text></TEI.2>'
+    root = etree.fromstring(file_xml)
+    whole_file = pipeline.process_tree(root)
+
+    # entry by entry, passing the author on, gives the same result as the whole file
+    last_author = None
+    new_elements = 0
+
+    for entry in etree.fromstring(file_xml).iter("div2"):
+        result = pipeline.process_entry(entry, last_author)
+        last_author = result.last_author
+        new_elements += result.new_elements
+
+    assert whole_file.new_elements == new_elements
+
+def test_invalid_stage():
+    with pytest.raises(ValueError):
+        Pipeline(["ids"])
+
+    with pytest.raises(ValueError):
+        Pipeline(["add"]).process_entry(etree.fromstring("<div1/>"))
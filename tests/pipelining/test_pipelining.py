@@ -0,0 +1,38 @@
+import threading
+import pytest
+from lsj_logeion_tools.pipelining.pipelining import *
+
+def test_run_pipelined():
+    written = []
+    process_threads = set()
+
+    def process(item, data):
+        process_threads.add(threading.current_thread())
+        return data * 10
+
+    results = list(run_pipelined(range(5), lambda item: item + 1, process, lambda item, data: written.append(item), prefetch=2))
+
+    assert results == [(0, 10), (1, 20), (2, 30), (3, 40), (4, 50)]
+    assert written == [0, 1, 2, 3, 4]
+    # processing happens in the calling thread
+    assert process_threads == {threading.current_thread()}
+
+@pytest.mark.parametrize("failing_step", ["read", "process", "write"])
+def test_run_pipelined_error(failing_step):
+    def step(name):
+        def run(item, *data):
+            if name == failing_step and item == 2:
+                raise ValueError(name)
+            return item
+
+        return run
+
+    results = []
+
+    with pytest.raises(ValueError, match=failing_step):
+        for item, result in run_pipelined(range(100), step("read"), step("process"), step("write")):
+            results.append(item)
+
+    # the items before the failure are all done
+    assert results[:2] == [0, 1]
+    assert 2 not in results
@@ -0,0 +1,72 @@
+from lxml import etree
+from lsj_logeion_tools.pipeline.pipeline import Pipeline
+from lsj_logeion_tools.prefilter.prefilter import *
+
+file_xml = (
+    '<TEI.2><text><body><div1><head>A</head>\n'
+    '<div2 key="a"><head>a</head> <author>Hom.</author> Il. 1.1</div2>\n'
+    '<div2 key="b"><head>b</head> <author>Plu.</author> 2.123a</div2>\n'
+    '<div2 key="c"><head>c</head> Id. 2.37b</div2>\n'
+    '<div2 key="d"><head>d</head> <bibl n="Perseus:abo:tlg,0007,067:351c"><author>Plu.</author> 2.351c</bibl></div2>\n'
+    '<div2 key="e"/>\n'
+    '<div2 key="f"><head>f</head> <author>Th.</author> 1.2, 3.4</div2>\n'
+    '<div2 key="g"><head>&#947;</head> <author>Ar.</author> Av. 12</div2>\n'
+    '</div1></body></text></TEI.2>'
+).encode("utf-8")
+
+def get_marked(data: bytes, stages: list[str]) -> list[bool]:
+    return [entry.marked for entry in prefilter_entries(data, stages)[2]]
+
+def test_prefilter_entries():
+    root_start, root_end, entries = prefilter_entries(file_xml, ["id", "add", "amend"])
+
+    assert (root_start, root_end) == (0, len(file_xml))
+
+    # each span is the whole entry, without its tail
+    root = etree.fromstring(file_xml)
+
+    for entry, element in zip(entries, root.iter("div2")):
+        assert etree.tostring(etree.fromstring(file_xml[entry.start:entry.end])) == etree.tostring(element, with_tail=False)
+
+    assert get_marked(file_xml, ["id", "add", "amend"]) == [False, True, True, True, False, False, True]
+    assert get_marked(file_xml, ["add"]) == [False, True, False, True, False, False, True]
+    assert get_marked(file_xml, ["amend"]) == [False, False, False, True, False, False, True]
+
+def test_prefilter_entries_falls_back():
+    # a reference outside the entries
+    assert prefilter_entries(file_xml.replace(b"<head>A</head>", b"<head>A</head> <author>Plu.</author> 2.1a"), ["add"]) is None
+
+    # entities which could hide a marker
+    assert prefilter_entries(b'<!DOCTYPE TEI.2 [<!ENTITY p "Plu.">]>' + file_xml, ["add"]) is None
+
+    # nested or unclosed entries
+    assert prefilter_entries(b"<div1><div2><div2></div2></div2></div1>", ["add"]) is None
+    assert prefilter_entries(b"<div1><div2></div1>", ["add"]) is None
+
+    # carriage returns, which would be kept between the entries but not within those transformed
+    assert prefilter_entries(file_xml.replace(b"\n", b"\r\n"), ["add"]) is None
+
+    # no entries
+    assert prefilter_entries(b"<div1><head>A</head></div1>", ["add"]) is None
+
+def test_unmarked_entries_are_unchanged():
+    # no false negatives: an unmarked entry is unchanged by the stages, whatever author is in force before it
+    for stages in (["id", "add", "amend"], ["add", "amend"], ["amend"]):
+        pipeline = Pipeline(stages, verify=False)
+
+        for entry in prefilter_entries(file_xml, stages)[2]:
+            entry_bytes = file_xml[entry.start:entry.end]
+
+            for last_author in (None, "Hom.", "Plu."):
+                if entry.marked or (last_author == "Plu." and could_change_unmarked(entry_bytes)):
+                    continue
+
+                new_bytes, result = pipeline.process_bytes(entry_bytes, last_author)
+
+                assert result.new_elements == 0
+                assert new_bytes == etree.tostring(etree.fromstring(entry_bytes), encoding="utf-8")
+
+def test_could_change_unmarked():
+    assert could_change_unmarked(b'<div2><author>Hom.</author></div2>')
+    assert could_change_unmarked(b'<div2><sense>cf. 2.37b</sense></div2>')
+    assert not could_change_unmarked(b'<div2><sense>no references</sense></div2>')
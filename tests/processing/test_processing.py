@@ -0,0 +1,38 @@
+from lsj_logeion_tools.manifest.manifest import load_manifest, make_manifest_entry, save_manifest
+from lsj_logeion_tools.processing.processing import *
+
+file_xml = (
+    '<TEI.2><text><body><div1>\n'
+    '<div2 key="a"><head>a</head> <author>Plu.</author> 2.123a</div2>\n'
+    '<div2 key="b"><head>b</head> Id. 2.351c</div2>\n'
+    '</div1></body></text></TEI.2>'
+)
+
+def test_process_headwords_checks_stages(tmp_path, capsys):
+    source, destination = tmp_path / "source", tmp_path / "destination"
+    source.mkdir()
+    destination.mkdir()
+    (source / "greatscott01.xml").write_text(file_xml, encoding="utf-8")
+    path_from, path_to = str(source) + "/", str(destination) + "/"
+    stages = ["id", "add", "amend"]
+
+    process_file("greatscott01.xml", stages, path_from, path_to)
+    output = (destination / "greatscott01.xml").read_bytes()
+
+    # an output which the manifest does not record is left alone
+    assert list(process_headwords(["greatscott01.xml"], stages, path_from, path_to, "b")) == []
+    assert "ERROR" in capsys.readouterr().out
+
+    manifest = load_manifest(path_to)
+    manifest["files"]["greatscott01.xml"] = make_manifest_entry("", "", stages)
+    save_manifest(path_to, manifest)
+
+    # as is an output made by other stages, which would lose the <author> of the id stage
+    assert list(process_headwords(["greatscott01.xml"], ["amend"], path_from, path_to, "b")) == []
+    assert "was made by the stages id,add,amend, not amend" in capsys.readouterr().out
+    assert (destination / "greatscott01.xml").read_bytes() == output
+
+    # the same stages make the same entry again
+    assert [file for file, _, _ in process_headwords(["greatscott01.xml"], stages, path_from, path_to, "b")] == ["greatscott01.xml"]
+    assert (destination / "greatscott01.xml").read_bytes() == output
+    assert b"<author>Id.</author>" in output
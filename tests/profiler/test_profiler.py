@@ -0,0 +1,22 @@
+from lsj_logeion_tools.profiler.profiler import *
+
+def test_make_report():
+    first = FileProfile("greatscott01.xml")
+    with first.stage("parse"):
+        pass
+    first.count("references_wrapped", 3)
+
+    second = FileProfile("greatscott02.xml")
+    with profile_stage(second, "parse"):
+        pass
+    second.count("references_wrapped")
+
+    with profile_stage(None, "parse"):
+        pass
+
+    report = make_report([first.to_dict(), second.to_dict()], 1.0)
+
+    assert list(report["stages"]) == ["parse"]
+    assert report["counters"] == {"references_wrapped": 4}
+    assert [file_profile["file"] for file_profile in report["files"]] == ["greatscott01.xml", "greatscott02.xml"]
+    assert report["peak_memory_kb"] > 0
@@ -0,0 +1,52 @@
+from lxml import etree
+from lsj_logeion_tools.add_moralia_references.add_moralia_references import get_reference_elements, wrap_references
+# the registry used by the add stage, which imports it from the lsj_logeion_tools folder
+from resolvers.resolvers import get_resolver, make_range_resolver, register_resolver, resolvers
+
+def test_range_resolver(tmp_path):
+    tsv_path = tmp_path / "plato.tsv"
+    tsv_path.write_text(
+        "author\twork\tstart\tend\tgreek_title\tlatin_title\tabbreviation\n"
+        "59\t30\t327a\t621d\tΠολιτεία\tRespublica\tR.\n",
+        encoding="utf-8",
+    )
+    register_resolver(make_range_resolver("Pl.", str(tsv_path)))
+
+    try:
+        root = etree.fromstring("<div2><author>Pl.</author> 514a; <author>Plu.</author> 2.352a</div2>")
+        plato, plutarch = root.findall("author")
+
+        # one traversal finds the references to both authors
+        reference_elements = get_reference_elements(root)
+        assert reference_elements == [(plato, get_resolver("Pl.")), (plutarch, get_resolver("Plu."))]
+
+        for element, resolver in reference_elements:
+            wrap_references(element, resolver=resolver)
+
+        assert [bibl.get("n") for bibl in root.iter("bibl")] == ["Perseus:abo:tlg,0059,030:514a", "Perseus:abo:tlg,0007,089:352a"]
+        assert root.find("bibl/title").text == "R."
+
+    finally:
+        resolvers.pop("Pl.")
+
+def test_range_resolver_grammar(tmp_path):
+    tsv_path = tmp_path / "plato.tsv"
+    tsv_path.write_text(
+        "author\twork\tstart\tend\tgreek_title\tlatin_title\tabbreviation\n"
+        "59\t2\t17a\t42a\tἈπολογία Σωκράτους\tApologia\tAp.\n"
+        "59\t3\t43a\t54e\tΚρίτων\tCrito\tCri.\n",
+        encoding="utf-8",
+    )
+    register_resolver(make_range_resolver("Pl.", str(tsv_path)))
+
+    try:
+        # a stephanus after the last work, or with Plutarch's volume, is not a reference to Plato
+        root = etree.fromstring("<div2><author>Pl.</author> Ap. 20a, 2.21b; R. 327a</div2>")
+
+        for element, resolver in get_reference_elements(root):
+            wrap_references(element, resolver=resolver)
+
+        assert [bibl.get("n") for bibl in root.iter("bibl")] == ["Perseus:abo:tlg,0059,002:20a"]
+
+    finally:
+        resolvers.pop("Pl.")
@@ -0,0 +1,29 @@
+import io
+from lxml import etree
+
+from lsj_logeion_tools.streaming.streaming import *
+
+input_xml = b"""<TEI.2><text><body><div1 n="a"><head>A</head> text <!-- comment --><div2 id="1"><head>a</head> <author>Plu.</author> 2.37b</div2>
+<div2 id="2"><head>b</head><empty/></div2>
+</div1><empty/></body></text></TEI.2>"""
+
+def test_stream_entries_matches_whole_tree():
+    output = io.BytesIO()
+    stream_entries(io.BytesIO(input_xml), output, lambda entry: 0)
+
+    assert output.getvalue() == etree.tostring(etree.fromstring(input_xml), encoding="utf-8")
+
+def test_stream_entries_processes_each_entry():
+    heads = []
+
+    def process_entry(entry):
+        heads.append(entry.find("head").text)
+        entry.set("processed", "true")
+        return 1
+
+    output = io.BytesIO()
+    counter = stream_entries(io.BytesIO(input_xml), output, process_entry)
+
+    assert counter == 2
+    assert heads == ["a", "b"]
+    assert len(etree.fromstring(output.getvalue()).findall(".//div2[@processed='true']")) == 2
@@ -8,4 +8,58 @@ def test_is_larger_stephanus():
     ]
 
     for entry in valid_args:
-        assert is_larger_stephanus(entry[0], entry[1])
\ No newline at end of file
+        assert is_larger_stephanus(entry[0], entry[1])
+
+def test_stephanus_ordinal():
+    assert Stephanus.from_string("1a").ordinal == 6
+    assert Stephanus.from_string("512b") < Stephanus.from_string("512c") < Stephanus.from_string("513a")
+    assert str(Stephanus.from_string("1147f")) == "1147f"
+    assert stephanus_ordinal("2.34b") is None
+
+def test_get_call_counts():
+    before = get_call_counts()
+    stephanus_ordinal("1000c")
+    stephanus_ordinal("1000c")
+
+    # a lookup is counted whether or not it is cached
+    calls = get_call_counts() - before
+    assert calls["stephanus_ordinal_cache:hits"] + calls["stephanus_ordinal_cache:misses"] == 2
+    assert calls["stephanus_ordinal_cache:hits"] >= 1
+
+def test_get_tlg_reference():
+    assert get_tlg_reference("1a", get_moralia_table().work_index) == (7, 67, "Lib. educ.")
+    # a stephanus at the boundary of two works belongs to the later one
+    assert get_tlg_reference("37b", get_moralia_table().work_index) == (7, 69, "Aud.")
+    assert get_tlg_reference("1147e", get_moralia_table().work_index) == (94, 2, "Mus.")
+
+def test_has_reference():
+    assert has_reference("Plu. 2.123a")
+    assert has_reference("345b, 346c")
+    assert not has_reference("1148a")
+    assert not has_reference("IG 3.123a")
+
+def test_find_references():
+    references = find_references("Plu. 2.123a, 345b; 1200b, 346c")
+    assert [(r.raw, r.stephanus) for r in references] == [("2.123a", "123a"), ("345b", "345b")]
+    assert references[0][:2] == (5, 11)
+    assert references[1].ordinal == stephanus_ordinal("345b")
+
+    # the split pattern wraps "5a" after "x." although has_reference only sees "7b"
+    assert [r.stephanus for r in find_references("x.5a 7b")] == ["5a", "7b"]
+    assert find_references("IG 3.123a") == []
+    assert find_references(None) == []
+
+def test_moralia_table():
+    table = get_moralia_table()
+
+    assert table.get(7, 89).abbreviation == "Isid."
+    assert table.get(94, 89) is None
+    assert 3 in table.valid_works
+    assert get_stephanus_range(get_moralia_info("089", "0007")) == ("351c", "384c")
+
+def test_get_search_scope():
+    entry = etree.fromstring("<div2><sense><title>A</title><bibl/><title>B</title><cit><bibl/></cit></sense></div2>")
+    sense = entry.find("sense")
+
+    assert get_search_scope(entry.find(".//cit/bibl"), "div2") is sense
+    assert get_search_scope(sense, "div2") is entry
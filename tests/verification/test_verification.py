@@ -0,0 +1,28 @@
+from lxml import etree
+from lsj_logeion_tools.verification.verification import *
+
+def test_hash_entry_text():
+    entry = etree.fromstring("<div2><head>λέξις</head>, <author>Plu.</author> 2.123a, 345b</div2>")
+    hashed_entries = hash_entries(entry)
+
+    # new <title> text and whitespace do not change the text of the entry
+    bibl = etree.SubElement(entry, "bibl")
+    title = etree.SubElement(bibl, "title")
+    title.text = "Isid."
+    title.tail = " 345b"
+    entry.find("author").tail = " 2.123a, "
+    assert get_changed_headwords(hashed_entries) == []
+
+    # moving text does
+    entry.find("author").tail = " 345b, "
+    title.tail = " 2.123a"
+    assert get_changed_headwords(hashed_entries) == ["λέξις"]
+
+def test_hash_entry_text_order():
+    # the tail of an element follows the text of its children
+    first = etree.fromstring("<div2><sense>a<cit>b</cit>c</sense>d</div2>")
+    second = etree.fromstring("<div2><sense>a<cit>b</cit></sense>cd</div2>")
+    third = etree.fromstring("<div2><sense>a<cit>bc</cit></sense>d</div2>")
+
+    assert hash_entry_text(first) == hash_entry_text(second) == hash_entry_text(third)
+    assert hash_entry_text(first) != hash_entry_text(etree.fromstring("<div2><sense>a<cit>c</cit>b</sense>d</div2>"))
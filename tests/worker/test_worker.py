@@ -0,0 +1,23 @@
+import io, json
+from lsj_logeion_tools.pipeline.pipeline import Pipeline
+from lsj_logeion_tools.worker.worker import *
+
+def test_serve_stream():
+    requests = io.StringIO(
+        json.dumps({"id": 1, "xml": '<div2 key="a"><head>a</head> 2.123a</div2>', "last_author": "Plu."}) + "\n"
+        "\n"
+        "not json\n"
+        + json.dumps({"id": 2, "xml": "<div2>"}) + "\n"
+    )
+    replies = io.StringIO()
+
+    serve_stream(Pipeline(["add"]), requests, replies)
+    first, invalid, unparsable = [json.loads(line) for line in replies.getvalue().splitlines()]
+
+    assert first["id"] == 1
+    assert first["new_elements"] == 1
+    assert '<bibl n="Perseus:abo:tlg,0007,077:123a">' in first["xml"]
+    assert first["last_author"] == "Plu."
+    assert "error" in invalid
+    assert unparsable["id"] == 2
+    assert unparsable["error"].startswith("XMLSyntaxError")